@@ -0,0 +1,757 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Export formats for the World hierarchy, fed by a single walk of the hierarchy (see World.export)
+#
+import os
+import io
+import json
+import hashlib
+import shutil
+import gzip
+import bz2
+import lzma
+import sqlite3
+from datetime import datetime, timedelta
+from decimal import Decimal
+import struct
+import multiprocessing
+from itertools import repeat
+import numpy as np
+import shapefile
+
+EXPORT_BUFFER = 1 << 20 # text exports are written in chunks of about this many bytes
+MANIFEST = 'manifest.json' # fingerprints of the exports in a directory, to skip unchanged ones (see World.export)
+
+COMPRESSION = {'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz'} # stdlib codecs for text exports, by file extension when not given
+
+# base class of the export formats: open, one write per area in export order, then close
+class Writer:
+	
+	appendable = False # rows of new dates can be appended to an earlier export (see startAppend)
+	labels = ['CONFIRMED', 'DEATHS', 'RECOVERED'] # data exported (the inputs fingerprinted, see unchanged)
+	partitionable = True # can be written in country partitions that are joined afterwards (see exportParallel)
+	partitions = [] # values of the partition option, to split the output into several files (see ShapefileWriter)
+	
+	def __init__(self, world, filename, compress = None, chunk = 0, append = False):
+		# compress: stream text into a compressed file (see COMPRESSION), default by the filename's extension
+		# chunk: split text into files of about this many bytes, each with the header (see chunkName)
+		# append: only append the rows of new dates to the earlier export, if nothing else changed
+		self.world = world
+		self.filename = filename
+		self.n = 0 # records written (a partition starts at the records of the partitions before it)
+		self.first = True # first (or only) partition, which holds the file header
+		self.verbose = True
+		self.compress = compress
+		if compress == None:
+			for codec, ext in COMPRESSION.items():
+				if filename.endswith(ext): self.compress = codec
+		self.chunk = chunk
+		self.chunks = [] # files written
+		self.append = append
+		self.skip = 0 # dates already in the file when appending
+	
+	def open(self):
+		pass
+	
+	def write(self, area, d):
+		# d: {'C': confirmed, 'D': deaths, 'R': recovered} totals of the area
+		pass
+	
+	def close(self):
+		pass
+	
+	def options(self):
+		# keyword arguments to create the same writer for another file
+		return {'compress': self.compress, 'chunk': self.chunk, 'append': self.append}
+	
+	def openText(self, header = ''):
+		# text output, header only in the first partition (or in each chunk)
+		self.header = header
+		self.fileout = self.__openFile(self.filename if self.chunk <= 0 else Writer.chunkName(self.filename, 0), \
+			'a' if self.skip > 0 else 'w')
+		self.size = 0 # characters written to the current chunk
+		if self.first: self.writeText(header)
+	
+	def writeText(self, s):
+		# a new chunk starts if this text would overflow the current one (whole areas stay together);
+		# sizes are bytes of the file, compressed text is estimated at the chunk's ratio so far
+		# (the compressor holds back some output, so compressed chunks can come out a little larger)
+		if self.chunk > 0 and self.size > len(self.header):
+			size = self.raw.tell()
+			n = len(s.encode(self.fileout.encoding)) if self.compress == None else len(s) * size / self.size
+			if size + n > self.chunk:
+				self.closeFile()
+				self.fileout = self.__openFile(Writer.chunkName(self.filename, len(self.chunks)))
+				self.size = 0
+				self.writeText(self.header)
+		self.fileout.write(s)
+		self.size += len(s)
+	
+	def openBinary(self):
+		# binary output (no chunks or appending)
+		self.fileout = self.__openFile(self.filename, 'w', True)
+	
+	def __openFile(self, filename, mode = 'w', binary = False):
+		# compressed files are appended to as a new stream (member), which readers join
+		# the file itself is kept as raw (bytes written so far, see writeText); text is passed through to it on each write
+		self.chunks.append(filename)
+		self.raw = open(filename, mode + 'b', buffering = EXPORT_BUFFER)
+		f = self.raw
+		if self.compress == 'gzip': f = gzip.GzipFile(filename, mode + 'b', 6, f, mtime = 0) # gzip's default level, reproducible
+		if self.compress == 'bz2': f = bz2.BZ2File(f, mode + 'b')
+		if self.compress == 'lzma': f = lzma.LZMAFile(f, mode + 'b')
+		return f if binary else io.TextIOWrapper(f, write_through = True)
+	
+	def closeFile(self):
+		# the (compressed) stream, then the file under it (compressed streams leave it open)
+		self.fileout.close()
+		self.raw.close()
+	
+	def removeChunks(self, filename = None):
+		# chunks of an earlier export to filename (default the writer's) after the last one written (the export has fewer chunks now)
+		if self.chunk <= 0: return
+		if filename == None: filename = self.filename
+		i = len(self.chunks)
+		while os.path.isfile(Writer.chunkName(filename, i)):
+			os.remove(Writer.chunkName(filename, i))
+			i += 1
+	
+	def startAppend(self):
+		# incremental export: keep the rows of the dates in the earlier export if nothing else changed since (see finishAppend),
+		# else the file is rewritten
+		self.n0 = self.n
+		if not self.append: return
+		state = None
+		if os.path.isfile(self.filename) and os.path.isfile(self.filename + '.state'):
+			with open(self.filename + '.state') as f:
+				state = json.load(f)
+		dates = self.world.getDates()
+		if state == None: 
+			reason = 'no earlier export'
+		elif state['format'] != type(self).__name__ or state['compress'] != self.compress: 
+			reason = 'different format'
+		elif len(dates) == 0 or state['start'] != dates[0].strftime('%Y-%m-%d') or state['length'] > len(dates): 
+			reason = 'different dates'
+		elif state['fingerprint'] != self.fingerprint(state['length']): 
+			reason = 'areas or history revised'
+		else:
+			self.skip = state['length']
+			self.n = self.n0 = state['n']
+			self.first = False
+			if self.verbose: print('  Appending ' + str(len(dates) - self.skip) + ' new date(s) from N ' + str(self.n + 1))
+			return
+		if self.verbose: print('  Full export (' + reason + ')')
+	
+	def finishAppend(self):
+		# state of the export for the next incremental export, including the N range added by this one
+		if not self.append: return
+		state = {'format': type(self).__name__, 'compress': self.compress, 'length': self.world.lenData(), \
+			'start': self.world.getDates()[0].strftime('%Y-%m-%d') if self.world.lenData() > 0 else None, 'n': self.n, \
+			'appended': [self.n0 + 1, self.n], 'fingerprint': self.fingerprint(self.world.lenData())}
+		with open(self.filename + '.state', 'w') as f:
+			json.dump(state, f, indent = 1)
+	
+	def fingerprint(self, length):
+		# hash of all that is exported for the first length dates: areas in order with their attributes and values
+		h = hashlib.sha1()
+		for area in self.world.exportAreas():
+			h.update('|'.join([area.a['fips'], area.a['adm3'], area.a['adm2'], area.a['adm1'], area.a['key'], \
+				str(area.a['lat']), str(area.a['lon'])]).encode('utf-8') + b'\n')
+			for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+				h.update(np.ascontiguousarray(area.getData(label)[:length], dtype = '<i8').tobytes())
+		return h.hexdigest()
+	
+	def outputs(self, filename):
+		# files of the export to filename (a copy has the same files as the original)
+		files = [Writer.chunkName(filename, i) for i in range(len(self.chunks))] if self.chunk > 0 else [filename]
+		return files + ([filename + '.state'] if self.append else [])
+	
+	def settings(self):
+		# the writer's type and options as text, arrays (e.g. forecasts) by their hash
+		return json.dumps([type(self).__name__, self.options()], sort_keys = True, \
+			default = lambda v: hashlib.sha1(np.ascontiguousarray(v).tobytes()).hexdigest() + str(v.shape) if isinstance(v, np.ndarray) else str(v))
+	
+	def digest(self, fingerprint):
+		# one hash of the writer's settings and its labels' fingerprints
+		return hashlib.sha1((self.settings() + json.dumps([fingerprint['labels'][label] for label in self.labels])).encode('utf-8')).hexdigest()
+	
+	def unchanged(self, manifest, filename, fingerprint):
+		# same data and settings as the last export to filename, and its files are still as written then
+		entry = manifest.get('exports', {}).get(os.path.basename(filename))
+		if entry == None or entry['digest'] != self.digest(fingerprint): return False
+		files = [(os.path.join(os.path.dirname(filename), f), size) for f, size in entry['files'].items()]
+		return all([os.path.isfile(f) and os.path.getsize(f) == size for f, size in files])
+	
+	def record(self, manifest, filename, fingerprint):
+		if 'exports' not in manifest: manifest['exports'] = {}
+		manifest['exports'][os.path.basename(filename)] = {'digest': self.digest(fingerprint), \
+			'files': {os.path.basename(f): os.path.getsize(f) for f in self.outputs(filename) if os.path.isfile(f)}}
+	
+	@staticmethod
+	def pgField(b):
+		# binary COPY field: length, then the value
+		return struct.pack('>i', len(b)) + b
+	
+	@staticmethod
+	def pgNumeric(value, scale = 6):
+		# binary numeric: number of base 10000 digits, weight of the first digit, sign, display scale, digits
+		n = abs(int(Decimal(str(value)).scaleb(scale).to_integral_value()))
+		whole, frac = divmod(n, 10 ** scale)
+		frac = str(frac).zfill(scale)
+		frac += '0' * (-len(frac) % 4)
+		digits = []
+		while whole > 0:
+			whole, digit = divmod(whole, 10000)
+			digits.insert(0, digit)
+		weight = len(digits) - 1
+		digits += [int(frac[i:i + 4]) for i in range(0, len(frac), 4)]
+		while len(digits) > 0 and digits[0] == 0: # normalized: no leading or trailing zero digits
+			digits.pop(0)
+			weight -= 1
+		while len(digits) > 0 and digits[-1] == 0:
+			digits.pop()
+		if len(digits) == 0: weight = 0
+		sign = 0x4000 if value < 0 and len(digits) > 0 else 0
+		return struct.pack('>hhHh', len(digits), weight, sign, scale) + struct.pack('>' + str(len(digits)) + 'h', *digits)
+	
+	@staticmethod
+	def chunkName(filename, i):
+		# data_transposed.txt.gz => data_transposed.000.txt.gz
+		folder, name = os.path.split(filename)
+		name = name.split('.', 1)
+		return os.path.join(folder, name[0] + '.' + '%03d' % i + ('.' + name[1] if len(name) > 1 else ''))
+	
+	def perArea(self):
+		# records written per area
+		return 3
+	
+	@staticmethod
+	def merge(parts, filename):
+		# join partitions written in parallel (see exportParallel), in order
+		with open(filename, 'wb') as fileout:
+			for part in parts:
+				with open(part, 'rb') as f:
+					shutil.copyfileobj(f, fileout, EXPORT_BUFFER)
+				os.remove(part)
+	
+	def copyTo(self, filename):
+		# duplicate the finished export (all of its chunks)
+		if self.chunk > 0:
+			for i, chunk in enumerate(self.chunks):
+				self.copy(chunk, Writer.chunkName(filename, i))
+			self.removeChunks(filename)
+		else:
+			self.copy(self.filename, filename)
+	
+	@staticmethod
+	def copy(src, dst):
+		print('Copying [' + src + '] to [' + dst + ']...')
+		shutil.copyfile(src, dst)
+
+# one row per area and data type, one column per date
+class StandardWriter(Writer):
+	
+	def open(self):
+		if self.verbose: print('Exporting (Standard) World [' + self.filename + ']...')
+		self.openText('|'.join(['N|FIPS|ADM3|ADM2|ADM1|KEY|LAT|LON|T'] + [da.strftime('%m/%d/%Y') for da in self.world.getDates()]) + '\n')
+	
+	def write(self, area, d):
+		# whole rows are joined at once, values converted by tolist (same text as str of each value)
+		s = '|' + area.a['fips'] + '|' + area.a['adm3'] + '|' + area.a['adm2'] + '|' + area.a['adm1'] + '|' + \
+			area.a['key'] + '|' + str(area.a['lat']) + '|' + str(area.a['lon']) + '|'
+		lines = []
+		for t in ['C','D','R']:
+			self.n += 1
+			lines.append('|'.join([str(self.n) + s + t] + list(map(str, d[t].tolist()))))
+		lines.append('')
+		self.writeText('\n'.join(lines))
+	
+	def close(self):
+		self.closeFile()
+
+# forecasts in the standard layout: one row per area and forecast label (T is its first letter), one column per day after the data
+class ForecastWriter(Writer):
+	
+	def __init__(self, world, filename, compress = None, chunk = 0, append = False, forecasts = {}):
+		# forecasts: {label: (areas x days) matrix, one row per world row}, see World.exportForecast
+		super().__init__(world, filename, compress, chunk, append)
+		self.forecasts = forecasts
+	
+	def options(self):
+		options = super().options()
+		options['forecasts'] = self.forecasts
+		return options
+	
+	def open(self):
+		if self.verbose: print('Exporting (Forecast) World [' + self.filename + ']...')
+		days = max([m.shape[1] for m in self.forecasts.values()] + [0])
+		last = self.world.getDates()[-1]
+		self.openText('|'.join(['N|FIPS|ADM3|ADM2|ADM1|KEY|LAT|LON|T'] + \
+			[(last + timedelta(days = i + 1)).strftime('%m/%d/%Y') for i in range(days)]) + '\n')
+	
+	def write(self, area, d):
+		s = '|' + area.a['fips'] + '|' + area.a['adm3'] + '|' + area.a['adm2'] + '|' + area.a['adm1'] + '|' + \
+			area.a['key'] + '|' + str(area.a['lat']) + '|' + str(area.a['lon']) + '|'
+		lines = []
+		for label, m in self.forecasts.items():
+			self.n += 1
+			lines.append('|'.join([str(self.n) + s + label[0]] + list(map(str, m[area.row()].tolist()))))
+		lines.append('')
+		self.writeText('\n'.join(lines))
+	
+	def perArea(self):
+		return len(self.forecasts)
+	
+	def close(self):
+		self.closeFile()
+
+# one row per area and date
+class TransposedWriter(Writer):
+	
+	appendable = True
+	
+	def open(self):
+		if self.verbose: print('Exporting (Transposed) World [' + self.filename + ']...')
+		self.startAppend()
+		self.dates = [da.strftime('%m/%d/%Y') for da in self.world.getDates()[self.skip:]] # formatted once
+		self.fileout = None
+		if self.skip == 0 or len(self.dates) > 0: self.openText('N|FIPS|ADM3|ADM2|ADM1|DATE|KEY|LAT|LON|CONFIRMED|DEATHS|RECOVERED\n')
+	
+	def write(self, area, d):
+		# one line per date (new dates only when appending), built column-wise: N, area, date, area, values
+		if self.fileout == None: return
+		s1 = '|' + area.a['fips'] + '|' + area.a['adm3'] + '|' + area.a['adm2'] + '|' + area.a['adm1'] + '|'
+		s2 = '|' + area.a['key'] + '|' + str(area.a['lat']) + '|' + str(area.a['lon']) + '|'
+		n = map(str, range(self.n + 1, self.n + len(self.dates) + 1))
+		self.n += len(self.dates)
+		self.writeText(''.join(map(''.join, zip(n, repeat(s1), self.dates, repeat(s2), map(str, d['C'][self.skip:].tolist()), repeat('|'), \
+			map(str, d['D'][self.skip:].tolist()), repeat('|'), map(str, d['R'][self.skip:].tolist()), repeat('\n')))))
+	
+	def perArea(self):
+		return self.world.lenData()
+	
+	def close(self):
+		if self.fileout != None: self.closeFile()
+		self.finishAppend()
+
+# PostGIS COPY format, one row per area and date (see scripts/psql.data.transposed.sql)
+class PGISWriter(Writer):
+	
+	appendable = True
+	
+	def open(self):
+		if self.verbose: print('Exporting (Transposed PostGIS COPY Format) World [' + self.filename + ']...')
+		self.startAppend()
+		self.dates = [da.strftime('%Y-%m-%d') for da in self.world.getDates()[self.skip:]] # formatted once
+		self.fileout = None
+		if self.skip == 0 or len(self.dates) > 0: self.openText()
+		#self.writeText('id|key|date|fips|adm3|adm2|adm1|lat|lon|geom|confirmed|deaths|recovered\n')
+	
+	def write(self, area, d):
+		# one line per date, built column-wise (see TransposedWriter)
+		if self.fileout == None: return
+		s1 = '|' + area.a['key'] + '|'
+		s2 = '|' + area.a['fips'] + '|' + area.a['adm3'] + '|' + area.a['adm2'] + '|' + area.a['adm1'] + \
+			'|' + str(area.a['lat']) + '|' + str(area.a['lon']) + '|'
+		n = map(str, range(self.n + 1, self.n + len(self.dates) + 1))
+		self.n += len(self.dates)
+		self.writeText(''.join(map(''.join, zip(n, repeat(s1), self.dates, repeat(s2), map(str, d['C'][self.skip:].tolist()), repeat('|'), \
+			map(str, d['D'][self.skip:].tolist()), repeat('|'), map(str, d['R'][self.skip:].tolist()), repeat('\n')))))
+	
+	def perArea(self):
+		return self.world.lenData()
+	
+	def close(self):
+		if self.fileout != None: self.closeFile()
+		self.finishAppend()
+
+# point shapefile (pyshp), one record per area and data type, one field per date
+class ShapefileWriter(Writer):
+	
+	partitions = ['month', 'adm1']
+	
+	def __init__(self, world, filename, compress = None, chunk = 0, append = False, partition = None):
+		# partition: one shapefile per month (fields of that month's dates, all areas) or per ADM1 (that country's areas,
+		#   N from 1 in each), named by partName, with a manifest of the files (see writeManifest); keeps the DBF narrow
+		super().__init__(world, filename, compress, chunk, append)
+		self.partition = partition
+	
+	def options(self):
+		options = super().options()
+		options['partition'] = self.partition
+		return options
+	
+	def parts(self):
+		# [(name, first date, last date + 1)] of the partitions, in order
+		dates = self.world.getDates()
+		if self.partition == 'month':
+			months = [da.strftime('%Y-%m') for da in dates]
+			return [(m, months.index(m), len(months) - months[::-1].index(m)) for m in sorted(set(months))]
+		if self.partition == 'adm1':
+			return [(self.world.key(), 0, len(dates))] + [(c.name(), 0, len(dates)) for c in self.world.areas()]
+		return []
+	
+	@staticmethod
+	def partName(filename, name):
+		# data_covid.shp, Korea, South => data_covid.Korea_South.shp
+		folder, base = os.path.split(filename)
+		base = base.split('.', 1)
+		name = ''.join([ch if ch.isalnum() or ch in '-_' else '_' for ch in name])
+		while '__' in name: name = name.replace('__', '_')
+		return os.path.join(folder, base[0] + '.' + name.strip('_') + ('.' + base[1] if len(base) > 1 else ''))
+	
+	def open(self):
+		if self.verbose: print('Exporting Shapefile [' + self.filename + ']' + \
+			(' by ' + self.partition if self.partition != None else '') + '...')
+		if self.partition == None: 
+			self.w = self.__newShapefile(self.filename, self.world.getDates())
+			return
+		self.files = {} # partition name: [shapefile, records written]
+		self.windows = {name: (i, j) for name, i, j in self.parts()}
+		if self.partition == 'month':
+			for name, (i, j) in self.windows.items():
+				self.files[name] = [self.__newShapefile(ShapefileWriter.partName(self.filename, name), self.world.getDates()[i:j]), 0]
+	
+	def __newShapefile(self, filename, dates):
+		w = shapefile.Writer(filename, shapefile.POINT)
+		w.autoBalance = 1
+		# create header
+		w.field('N','N')
+		w.field('FIPS','C','5')
+		w.field('ADM3','C','80')
+		w.field('ADM2','C','80')
+		w.field('ADM1','C','80')
+		w.field('KEY','C','255')
+		w.field('LAT','N',decimal=6)
+		w.field('LON','N',decimal=6)
+		w.field('T','C','1')
+		for da in dates:
+			w.field(da.strftime('%m/%d/%Y'), 'N')
+		return w
+	
+	def write(self, area, d):
+		if self.partition == None: 
+			for t in ['C','D','R']:
+				self.n += 1
+				self.w.point(area.a['lon'], area.a['lat'])
+				self.w.record(*area.getList4ShapefileExport(area, d[t], self.n, t))
+			return
+		if self.partition == 'month': 
+			files = list(self.files.keys())
+		else:
+			files = [area.a['adm1'] if area.level() > 0 else area.key()]
+			if files[0] not in self.files: 
+				self.files[files[0]] = [self.__newShapefile(ShapefileWriter.partName(self.filename, files[0]), self.world.getDates()), 0]
+		for t in ['C','D','R']:
+			self.n += 1
+			for name in files:
+				f = self.files[name]
+				f[1] += 1
+				i, j = self.windows[name]
+				f[0].point(area.a['lon'], area.a['lat'])
+				f[0].record(*area.getList4ShapefileExport(area, d[t][i:j], self.n if self.partition == 'month' else f[1], t))
+	
+	def close(self):
+		# write the file(s)
+		if self.partition == None: 
+			self.w.close()
+			ShapefileWriter.writePRJ(self.filename)
+			return
+		for name, f in self.files.items():
+			f[0].close()
+			ShapefileWriter.writePRJ(ShapefileWriter.partName(self.filename, name))
+		self.writeManifest(self.filename)
+	
+	@staticmethod
+	def writePRJ(filename):
+		# create the PRJ file
+		prj = open("%s" % filename.replace('.shp','.prj'), "w")
+		epsg = 'GEOGCS["WGS 84",'
+		epsg += 'DATUM["WGS_1984",'
+		epsg += 'SPHEROID["WGS 84",6378137,298.257223563]]'
+		epsg += ',PRIMEM["Greenwich",0],'
+		epsg += 'UNIT["degree",0.0174532925199433]]'
+		prj.write(epsg)
+		prj.close()
+	
+	@staticmethod
+	def manifestName(filename):
+		# data_covid.shp => data_covid.manifest.json
+		return ShapefileWriter.partName(filename, 'manifest').replace('.shp', '.json')
+	
+	def writeManifest(self, filename):
+		# the partitions' files (that exist) with their dates and records, read back from the DBF headers
+		dates = self.world.getDates()
+		files = []
+		for name, i, j in self.parts():
+			part = ShapefileWriter.partName(filename, name)
+			if not os.path.isfile(part.replace('.shp', '.dbf')): continue
+			with open(part.replace('.shp', '.dbf'), 'rb') as f:
+				n = struct.unpack('<I', f.read(8)[4:8])[0]
+			files.append({'name': name, 'file': os.path.basename(part), 'records': n, \
+				'dates': [dates[i].strftime('%m/%d/%Y'), dates[j - 1].strftime('%m/%d/%Y')] if j > i else []})
+		with open(ShapefileWriter.manifestName(filename), 'w') as f:
+			json.dump({'format': 'shapefile', 'partition': self.partition, 'parts': files}, f, indent = 1)
+	
+	def outputs(self, filename):
+		if self.partition == None: return [filename.replace('.shp', ext) for ext in ['.shp', '.shx', '.dbf', '.prj']]
+		return [ShapefileWriter.partName(filename, name).replace('.shp', ext) for name, i, j in self.parts() \
+			for ext in ['.shp', '.shx', '.dbf', '.prj']] + [ShapefileWriter.manifestName(filename)]
+	
+	def copyTo(self, filename):
+		if self.partition == None: 
+			ShapefileWriter.copy(self.filename, filename)
+			return
+		for name, i, j in self.parts():
+			if os.path.isfile(ShapefileWriter.partName(self.filename, name)): 
+				ShapefileWriter.copy(ShapefileWriter.partName(self.filename, name), ShapefileWriter.partName(filename, name))
+		self.writeManifest(filename)
+	
+	@staticmethod
+	def copy(src, dst):
+		for ext in ['.shp', '.shx', '.dbf', '.prj']:
+			Writer.copy(src.replace('.shp', ext), dst.replace('.shp', ext))
+	
+	def merge(self, parts, filename):
+		# each partition's file is joined from the process partitions' files of it (see mergeFiles)
+		if self.partition == None: 
+			ShapefileWriter.mergeFiles(parts, filename)
+			return
+		for name, i, j in self.parts():
+			files = [ShapefileWriter.partName(part, name) for part in parts if os.path.isfile(ShapefileWriter.partName(part, name))]
+			if len(files) > 0: ShapefileWriter.mergeFiles(files, ShapefileWriter.partName(filename, name))
+		for part in parts:
+			os.remove(ShapefileWriter.manifestName(part))
+		self.writeManifest(filename)
+	
+	@staticmethod
+	def mergeFiles(parts, filename):
+		# all records are points (fixed size), so the parts' records are joined as is and renumbered
+		shp = [open(part, 'rb').read() for part in parts]
+		dbf = [open(part.replace('.shp', '.dbf'), 'rb').read() for part in parts]
+		body = b''.join([b[100:] for b in shp])
+		n = len(body) // 28
+		records = np.frombuffer(body, dtype = np.uint8).reshape(n, 28).copy()
+		records[:, :4] = np.arange(1, n + 1, dtype = '>i4').view(np.uint8).reshape(n, 4) # record numbers
+		bbox = np.array([struct.unpack('<4d', b[36:68]) for b in shp])
+		bbox = struct.pack('<4d', bbox[:, 0].min(), bbox[:, 1].min(), bbox[:, 2].max(), bbox[:, 3].max())
+		with open(filename, 'wb') as f:
+			f.write(shp[0][:24] + struct.pack('>i', (100 + len(body)) // 2) + shp[0][28:36] + bbox + shp[0][68:100])
+			f.write(records.tobytes())
+		index = np.zeros((n, 2), dtype = '>i4')
+		index[:, 0] = 50 + 14 * np.arange(n) # offset (16 bit words)
+		index[:, 1] = 10 # content length
+		with open(filename.replace('.shp', '.shx'), 'wb') as f:
+			f.write(shp[0][:24] + struct.pack('>i', (100 + 8 * n) // 2) + shp[0][28:36] + bbox + shp[0][68:100])
+			f.write(index.tobytes())
+		n_header = struct.unpack('<H', dbf[0][8:10])[0]
+		with open(filename.replace('.shp', '.dbf'), 'wb') as f:
+			f.write(dbf[0][:4] + struct.pack('<I', n) + dbf[0][8:n_header])
+			for b in dbf:
+				f.write(b[n_header:])
+		shutil.move(parts[0].replace('.shp', '.prj'), filename.replace('.shp', '.prj'))
+		for part in parts:
+			for ext in ['.shp', '.shx', '.dbf', '.prj']:
+				if os.path.isfile(part.replace('.shp', ext)): os.remove(part.replace('.shp', ext))
+
+# PostgreSQL binary COPY format of the timeseries table (scripts/psql.data.transposed.sql), one row per area and date;
+# unlike the text format it has all columns including geom (EWKB point), so it loads with COPY ... (FORMAT binary) as is
+class PGCopyWriter(Writer):
+	
+	partitionable = False
+	
+	def open(self):
+		if self.verbose: print('Exporting (Transposed PostgreSQL Binary COPY Format) World [' + self.filename + ']...')
+		self.openBinary()
+		self.fileout.write(b'PGCOPY\n\xff\r\n\0' + struct.pack('>ii', 0, 0)) # signature, flags, header extension
+		epoch = datetime(2000, 1, 1) # postgres dates are days since 2000-01-01
+		self.dates = np.array([(da.replace(hour = 0, minute = 0, second = 0, microsecond = 0) - epoch).days \
+			for da in self.world.getDates()], dtype = int)
+	
+	def write(self, area, d):
+		# all rows of the area at once: fields are (length, value), the area's own fields are the same bytes in each row
+		key = Writer.pgField(area.a['key'].encode('utf-8'))
+		const = b''.join([Writer.pgField(area.a[k].encode('utf-8')) for k in ['fips', 'adm3', 'adm2', 'adm1']] + \
+			[Writer.pgField(Writer.pgNumeric(area.a['lat'])), Writer.pgField(Writer.pgNumeric(area.a['lon'])), \
+			Writer.pgField(struct.pack('<bIIdd', 1, 0x20000001, 4326, area.a['lon'], area.a['lat']))]) # EWKB point with SRID
+		rows = np.zeros(len(self.dates), dtype = [('fields', '>i2'), ('n_id', '>i4'), ('id', '>i4'), ('key', 'V' + str(len(key))), \
+			('n_date', '>i4'), ('date', '>i4'), ('const', 'V' + str(len(const))), ('n_c', '>i4'), ('c', '>i4'), ('n_d', '>i4'), ('d', '>i4'), \
+			('n_r', '>i4'), ('r', '>i4')])
+		rows['fields'] = 13
+		rows['n_id'] = rows['n_date'] = rows['n_c'] = rows['n_d'] = rows['n_r'] = 4
+		rows['id'] = np.arange(self.n + 1, self.n + len(self.dates) + 1)
+		rows['key'] = np.void(key)
+		rows['date'] = self.dates
+		rows['const'] = np.void(const)
+		rows['c'] = d['C']
+		rows['d'] = d['D']
+		rows['r'] = d['R']
+		self.n += len(self.dates)
+		self.fileout.write(rows.tobytes())
+	
+	def perArea(self):
+		return self.world.lenData()
+	
+	def close(self):
+		self.fileout.write(struct.pack('>h', -1)) # trailer
+		self.closeFile()
+
+# SQLite database with the timeseries table and indexes of scripts/psql.data.transposed.sql, one row per area and date
+# geom is WKT text and geom_idx a plain (lon, lat) index, as SQLite has no PostGIS types
+class SQLiteWriter(Writer):
+	
+	appendable = True
+	partitionable = False
+	batch = 50000 # rows per executemany
+	
+	def open(self):
+		if self.verbose: print('Exporting (SQLite) World [' + self.filename + ']...')
+		self.startAppend()
+		if self.skip == 0 and os.path.isfile(self.filename): os.remove(self.filename)
+		self.con = sqlite3.connect(self.filename)
+		if self.skip == 0: 
+			self.con.execute('PRAGMA synchronous = OFF') # new file, rebuilt on failure
+			self.con.execute('CREATE TABLE timeseries (id integer NOT NULL, key varchar(180) NOT NULL, date date, ' + \
+				'fips char(5) NOT NULL, adm3 varchar(60) NOT NULL, adm2 varchar(60) NOT NULL, adm1 varchar(60) NOT NULL, ' + \
+				'lat NUMERIC(9, 6), lon NUMERIC(9, 6), geom text, confirmed integer NOT NULL, deaths integer NOT NULL, ' + \
+				'recovered integer NOT NULL, CONSTRAINT fkey PRIMARY KEY(key, date))')
+		self.con.execute('BEGIN') # one transaction for the whole export
+		self.dates = [da.strftime('%Y-%m-%d') for da in self.world.getDates()[self.skip:]]
+		self.rows = []
+	
+	def write(self, area, d):
+		n = range(self.n + 1, self.n + len(self.dates) + 1)
+		self.n += len(self.dates)
+		self.rows.extend(zip(n, repeat(area.a['key']), self.dates, repeat(area.a['fips']), repeat(area.a['adm3']), \
+			repeat(area.a['adm2']), repeat(area.a['adm1']), repeat(area.a['lat']), repeat(area.a['lon']), \
+			repeat('POINT(' + str(area.a['lon']) + ' ' + str(area.a['lat']) + ')'), \
+			d['C'][self.skip:].tolist(), d['D'][self.skip:].tolist(), d['R'][self.skip:].tolist()))
+		if len(self.rows) >= self.batch: self.flush()
+	
+	def flush(self):
+		# new dates are upserted, so a repeated append does not fail on rows already there
+		self.con.executemany('INSERT INTO timeseries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ' + \
+			'ON CONFLICT(key, date) DO UPDATE SET confirmed = excluded.confirmed, deaths = excluded.deaths, ' + \
+			'recovered = excluded.recovered', self.rows)
+		self.rows = []
+	
+	def perArea(self):
+		return self.world.lenData()
+	
+	def close(self):
+		self.flush()
+		if self.skip == 0: # indexes after the bulk load
+			for sql in ['CREATE INDEX date_idx ON timeseries (date)', 'CREATE INDEX fips_idx ON timeseries (fips)', \
+				'CREATE INDEX key_idx ON timeseries (key)', 'CREATE INDEX confirmed_idx ON timeseries (confirmed)', \
+				'CREATE INDEX deaths_idx ON timeseries (deaths)', 'CREATE INDEX geom_idx ON timeseries (lon, lat)']:
+				self.con.execute(sql)
+		self.con.commit()
+		self.con.close()
+		self.finishAppend()
+
+def openText(filename, mode = 'r'):
+	# text file, (de)compressed by the filename's extension (see COMPRESSION)
+	opener = {'gzip': gzip.open, 'bz2': bz2.open, 'lzma': lzma.open}
+	for codec, ext in COMPRESSION.items():
+		if filename.endswith(ext): return opener[codec](filename, mode + 't')
+	return open(filename, mode)
+
+def readText(filename):
+	# whole text of an export (see openText)
+	with openText(filename) as f:
+		return f.read()
+
+def readManifest(directory):
+	# fingerprints of the last export to the directory (see World.export), empty if none
+	filename = os.path.join(directory, MANIFEST)
+	if not os.path.isfile(filename): return {}
+	with open(filename) as f:
+		return json.load(f)
+
+def writeManifest(directory, manifest):
+	with open(os.path.join(directory, MANIFEST), 'w') as f:
+		json.dump(manifest, f, indent = 1, sort_keys = True)
+
+# write the areas (in export order) to all writers
+def writeAreas(writers, areas):
+	for w in writers:
+		w.open()
+	for area in areas:
+		d = {'C': area.getData('CONFIRMED'), 'D': area.getData('DEATHS'), 'R': area.getData('RECOVERED')}
+		for w in writers:
+			w.write(area, d)
+	for w in writers:
+		w.close()
+		w.removeChunks()
+
+# world of the export workers: inherited when forked, else sent once per worker (not per task)
+_world = None
+
+def _initWorker(world):
+	global _world
+	_world = world
+
+def _writePart(task):
+	cls, filename, options, countries, n, first = task
+	w = cls(_world, filename, **options)
+	w.n = n
+	w.first = first
+	w.verbose = False
+	writeAreas([w], _world.exportAreas(countries, first))
+	return w.chunks
+
+# write each writer's file in country partitions on a pool of processes, then join the partitions in order
+# the files are the same as with writeAreas
+def exportParallel(world, writers, processes):
+	world.expand() # build all areas and totals once, before the workers start
+	for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+		world.getData(label)
+	# contiguous groups of countries of about the same number of areas, the world row goes with the first group
+	countries = [c.name() for c in world.areas()]
+	sizes = np.array([len(list(world.exportAreas([c], False))) for c in countries] + [0], dtype = int)[:max(1, len(countries))]
+	sizes[0] += 1
+	groups = np.minimum(processes * np.concatenate(([0], np.cumsum(sizes)[:-1])) // max(1, sizes.sum()), processes - 1)
+	tasks = []
+	parts = {}
+	for w in writers:
+		print('Exporting [' + w.filename + '] in ' + str(processes) + ' processes...')
+		if w.chunk > 0 or w.append or not w.partitionable: # chunks are cut by size in order, appends go after the earlier rows
+			tasks.append((type(w), w.filename, w.options(), None, 0, True))
+			parts[w.filename] = None
+			continue
+		root, ext = os.path.splitext(w.filename)
+		parts[w.filename] = []
+		before = 0 # areas in the partitions before
+		for g in range(processes):
+			names = [c for c, i in zip(countries, groups) if i == g]
+			if len(names) == 0 and g > 0: continue
+			filename = root + '.part' + str(g) + ext
+			tasks.append((type(w), filename, w.options(), names, before * w.perArea(), g == 0))
+			parts[w.filename].append(filename)
+			before += int(sizes[groups == g].sum())
+	global _world
+	if 'fork' in multiprocessing.get_all_start_methods():
+		_world = world
+		pool = multiprocessing.get_context('fork').Pool(processes)
+	else:
+		pool = multiprocessing.Pool(processes, _initWorker, (world,))
+	with pool:
+		chunks = pool.map(_writePart, tasks, 1)
+	_world = None
+	for w in writers:
+		if parts[w.filename] == None: 
+			w.chunks = [c for task, c in zip(tasks, chunks) if task[1] == w.filename][0]
+		else:
+			w.merge(parts[w.filename], w.filename)
+
+# registered export formats (World.export); add a Writer subclass here for a new format
+WRITERS = {
+	'standard': StandardWriter,
+	'transposed': TransposedWriter,
+	'pgis': PGISWriter,
+	'shapefile': ShapefileWriter,
+	'sqlite': SQLiteWriter,
+	'pgcopy': PGCopyWriter,
+	'forecast': ForecastWriter
+}
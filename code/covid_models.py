@@ -6,13 +6,25 @@
 import numpy as np
 from scipy.optimize import curve_fit 
 import sys
+import os
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 from datetime import datetime, timedelta
 import time
 import statsmodels.formula.api as smf
+import multiprocessing
+import warnings
+import hashlib
+import json
+import sqlite3
+from abc import ABC, abstractmethod
 #import math
 
+import covid_export as ce
+
+# fit results, one row per series (see Model.calculateMatrix and FitResults); a, b, c are NaN without a fit
+FIT_DTYPE = [('key', 'U255'), ('label', 'U40'), ('rsqd', 'f8'), ('a', 'f8'), ('b', 'f8'), ('c', 'f8'), ('si', 'i8'), ('error', 'U40')]
+
 class Error(Exception):
 	# Base class for exceptions in this module.
 	pass
@@ -29,28 +41,106 @@ class ModelError(Error):
 		self.expression = expression
 		self.message = message
 
-class Model:
+# growable table of fit results (FIT_DTYPE), the rows are in a structured array whose capacity is doubled when full
+class FitResults:
 	
-	def __init__(self, type = '?'):
-		self.a = {} # attributes
-		self.a['type'] = type
+	def __init__(self, size_estimate = 100, table = None):
+		# table: initial rows (copied)
+		self.__m = np.zeros(max(1, size_estimate), dtype = FIT_DTYPE)
+		self.__n = 0
+		if table is not None: self.extend(table)
+	
+	def add(self, key, label, rsqd, a = np.nan, b = np.nan, c = np.nan, si = -1, error = ''):
+		self.extend(np.array([(key, label, rsqd, a, b, c, si, error)], dtype = FIT_DTYPE))
+	
+	def extend(self, table):
+		# rows of another table (FIT_DTYPE, or FitResults)
+		table = table.table() if isinstance(table, FitResults) else np.asarray(table, dtype = FIT_DTYPE)
+		n = self.__n + len(table)
+		if n > len(self.__m):
+			temp = np.zeros(max(n, 2 * len(self.__m)), dtype = FIT_DTYPE)
+			temp[:self.__n] = self.__m[:self.__n]
+			self.__m = temp
+		self.__m[self.__n:n] = table
+		self.__n = n
+	
+	def table(self):
+		# the rows (a view, valid until rows are added)
+		return self.__m[:self.__n]
+	
+	def __len__(self):
+		return self.__n
+	
+	def __getitem__(self, column):
+		# column of the rows, e.g. results['rsqd']
+		return self.table()[column]
+	
+	def where(self, mask):
+		# rows where the mask is true, e.g. results.where(results['rsqd'] > 0.95)
+		return FitResults(table = self.table()[np.asarray(mask, dtype = bool)])
+	
+	def sort(self, columns = 'rsqd', reverse = False):
+		# rows sorted by the columns (name or list of names), ties keep their order
+		columns = [columns] if isinstance(columns, str) else list(columns)
+		t = self.table()
+		if reverse: # descending, ties by descending negative row number (ascending row number once reversed)
+			order = np.lexsort([-np.arange(len(t))] + [t[c] for c in reversed(columns)])[::-1]
+		else:
+			order = np.lexsort([t[c] for c in reversed(columns)])
+		return FitResults(table = t[order])
+	
+	def export(self, filename, format = None):
+		# format: 'text' (| separated with a header, like the standard export, compressed by extension),
+		#   'pgis' (PostgreSQL COPY text, with an id column) or 'sqlite' (table fits); default by the extension (.sql, .sqlite)
+		if format == None: format = 'sqlite' if filename.endswith('.sqlite') else 'pgis' if filename.endswith('.sql') else 'text'
+		print('Exporting (' + format + ') Fit Results [' + filename + ']...')
+		t = self.table()
+		# rows with N (from 1) first, NaN as None (no fit)
+		rows = [(n,) + tuple([None if v != v else v for v in row]) for n, row in zip(range(1, self.__n + 1), \
+			zip(*[t[c].tolist() for c in ['key', 'label', 'rsqd', 'a', 'b', 'c', 'si', 'error']]))]
+		if format == 'sqlite':
+			if os.path.isfile(filename): os.remove(filename)
+			con = sqlite3.connect(filename)
+			con.execute('CREATE TABLE fits (id integer PRIMARY KEY, key varchar(180) NOT NULL, label varchar(40) NOT NULL, ' + \
+				'rsqd real, a real, b real, c real, si integer, error varchar(40))')
+			con.executemany('INSERT INTO fits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+			con.execute('CREATE INDEX fits_key_idx ON fits (key)')
+			con.commit()
+			con.close()
+			return
+		if format not in ['text', 'pgis']: raise ModelError('export', 'Unknown format ' + str(format))
+		with ce.openText(filename, 'w') as f:
+			if format == 'text': f.write('N|KEY|LABEL|RSQD|A|B|C|SI|ERROR\n')
+			null = '' if format == 'text' else '\\N'
+			f.write(''.join(['|'.join([str(v) if v != None else null for v in row]) + '\n' for row in rows]))
 
-class Model_T1(Model):
+# base of the models: fits of one equation (a, b, c) to series normalized at their start (si), memoized, in batches;
+# a model defines its equation and its start estimate (estimateParams), see MODELS
+class Model(ABC):
 	
-	def __init__(self):
-		super().__init__('T1')
-		self.stats_i = 0 # index
+	def __init__(self, type = '?', warm = True):
+		# warm: start each fit from the series' last fit (see calculate's key) or else the model's estimate (estimateParams),
+		#   instead of curve_fit's default (all ones)
+		self.a = {} # attributes
+		self.a['type'] = type
 		self.resetStats(100)
+		self.warm = warm
+		self.cache = {} # memoized fits by digest of the input: (popt, rsqd, error)
+		self.last = {} # parameters of the last fit by series key (warm start)
+		self.used = set() # digests looked up or fitted since the cache was loaded (see saveCache)
+		self.n_fits = 0 # curve fits run
+		self.n_hits = 0 # memoized fits returned
 	
 	def calculate(self, d_data, y_data, label = 'DEFAULT', n_forecast = 0, r_thresh = 0.80, \
-		y_thresh = 1, debug = False):
+		y_thresh = 1, debug = False, key = None):
 		# d_data: list of dates in datetime format MM/DD/YYYY, pre sorted
 		# y_data: list of numbers (e.g. covid cases) of same length for each date
 		# label: label to apply for stat keeping, or None to skip
-		# n_forecast: number of days to forecast
+		# n_forecast: number of days to forecast (xm_data, ym_data go on this many days past the data)
 		# r_thresh: >= r-squared threshhold to run calculation range and update stats
 		# y_thresh: >= starting index y threshhold, e.g. 1 confirmed case
 		# debug: print additional lines
+		# key: name of the series (e.g. area key), for a warm start from its last fit
 		
 		self.a['last_error'] = None
 		# check data length
@@ -89,28 +179,32 @@ class Model_T1(Model):
 			print('y_data[si:] / y_data[si]:')
 			print(y_data[si:] / y_data[si])
 		
-		# curve fit
-		rsqd = -1
+		# curve fit, or the memoized fit of the same input
+		digest = self.digest(y_data, y_thresh)
+		if digest in self.cache:
+			popt, rsqd, error = self.cache[digest]
+			self.n_hits += 1
+		else:
+			popt, rsqd, error = self.fit(x_data[si:]-si, y_data[si:] / y_data[si], key)
+			self.cache[digest] = (popt, rsqd, error)
+			self.n_fits += 1
+		self.used.add(digest)
+		if (popt is not None and key != None): self.last[key] = popt
+		if (error != None):
+			self.a['last_error'] = error
+			return None, -1, None, None, si
 		try:
-			popt, pcov, perr, rsqd = self.fitWrapper(x_data[si:]-si, y_data[si:] / y_data[si])
-			if (rsqd < -1): rsqd = -1
-			rsqd = round(rsqd, 3)
 			if (debug): print('*', rsqd)
 			
 			if (rsqd > r_thresh):
 				# calc ALL curve fit values for 0 thru n-day forecast -> our trajectory
-				xm_data = np.array([i for i in range(size - si + 0)]) # n_forecast
+				xm_data = np.array([i for i in range(size - si + n_forecast)])
 				if (debug): print('lens:', len(xm_data), len(y_data[si:]))
-				ym_data = Model_T1.equation(xm_data, *popt) * y_data[si]
+				ym_data = self.equation(xm_data, *popt) * y_data[si]
 				ym_data = np.rint(ym_data) # since we want to force integer estimates
 				# update stats
 				if (label != None):
-					self.a[label][self.stats_i] = (rsqd, popt[0], popt[1], popt[2])
-					self.stats_i += 1
-					# auto expand by doubling
-					if (self.stats_i == len(self.a[label])-1):
-						temp = np.zeros((len(self.a[label]), 4))
-						self.a[label] = np.concatenate(self.a[label], temp, axis=0)
+					self.results.add(key if key != None else '', label, rsqd, popt[0], popt[1], popt[2], si)
 					self.a['last_error'] = None
 				if (debug): 
 					print('xm_data:')
@@ -134,18 +228,153 @@ class Model_T1(Model):
 			#raise
 			return None, -1, None, None, si
 	
+	def calculateAreas(self, areas, label = 'CONFIRMED', n_forecast = 0, r_thresh = 0.80, y_thresh = 1, processes = 1):
+		# batch version of calculate for the total data (label) of areas of one world, see calculateMatrix
+		areas = list(areas)
+		if len(areas) == 0: return np.zeros(0, dtype = FIT_DTYPE), []
+		y_matrix = np.array([area.getData(label) for area in areas])
+		return self.calculateMatrix(areas[0].world.getDates(), y_matrix, [area.key() for area in areas], label, \
+			n_forecast, r_thresh, y_thresh, processes)
+	
+	def calculateMatrix(self, d_data, y_matrix, keys = None, label = 'DEFAULT', n_forecast = 0, r_thresh = 0.80, \
+		y_thresh = 1, processes = 1):
+		# fit each row of y_matrix (series x dates) as calculate does, in contiguous blocks of rows on a pool of processes
+		# keys: name of each row (default its index); label: label of the rows in the results table
+		# returns the results table (FIT_DTYPE, rows in y_matrix order) and the calculate results of each row, in order;
+		# the table's rows are also added to the model's results store (all rows, unlike calculate's stats)
+		y_matrix = np.asarray(y_matrix)
+		if (len(y_matrix.shape) != 2 or y_matrix.shape[1] != len(d_data)):
+			raise ModelError('calculateMatrix', 'y_matrix is not a (series x ' + str(len(d_data)) + ') matrix.')
+		n = y_matrix.shape[0]
+		if keys is None: keys = [str(i) for i in range(n)]
+		options = {'n_forecast': n_forecast, 'r_thresh': r_thresh, 'y_thresh': y_thresh}
+		# a few blocks per process, so uneven fit times even out
+		# the workers only fit the rows that are not memoized, into the cache; the rows are then all taken from the cache in order
+		# (a worker starts from the same last parameters as this process would, so the fits do not depend on processes)
+		digests = [self.digest(y_data, y_thresh) for y_data in y_matrix]
+		misses = [i for i in range(n) if digests[i] not in self.cache]
+		if processes > 1 and len(misses) > 0:
+			n_blocks = min(len(misses), 4 * processes)
+			bounds = [len(misses) * i // n_blocks for i in range(n_blocks + 1)]
+			tasks = []
+			for j in range(n_blocks):
+				rows = misses[bounds[j]:bounds[j + 1]]
+				tasks.append((type(self), self.warm, {keys[i]: self.last[keys[i]] for i in rows if keys[i] in self.last}, d_data, \
+					y_matrix[rows], [keys[i] for i in rows], options))
+			context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing
+			with context.Pool(processes) as pool:
+				for cache, n_fits in pool.map(_fitRows, tasks, 1):
+					# in block order, first digest wins: an identical series later on is a memo hit, as in a single process
+					for digest, fit in cache.items(): self.cache.setdefault(digest, fit)
+					self.n_fits += n_fits
+			self.n_hits -= len([i for i in misses if digests[i] in self.cache]) # taken from the cache below, but fitted
+		fits = []
+		with warnings.catch_warnings(), np.errstate(over = 'ignore'):
+			warnings.simplefilter('ignore') # thousands of covariance and overflow warnings otherwise
+			for y_data, key in zip(y_matrix, keys):
+				fits.append(self.calculate(d_data, y_data, None, key = key, **options) + (self.a['last_error'],))
+		table = np.zeros(n, dtype = FIT_DTYPE)
+		table['key'] = keys
+		table['label'] = label
+		table['rsqd'] = [fit[1] for fit in fits]
+		table[['a', 'b', 'c']] = [tuple(fit[0]) if fit[0] is not None else (np.nan, np.nan, np.nan) for fit in fits]
+		table['si'] = [fit[4] for fit in fits]
+		table['error'] = [fit[5] if fit[5] != None else '' for fit in fits]
+		self.results.extend(table)
+		return table, [fit[:5] for fit in fits]
+	
+	def forecastMatrix(self, table, y_matrix, n_forecast, r_thresh = 0.80):
+		# the fits of a results table (rows of calculateMatrix) evaluated for the n_forecast days after the data, all rows at once
+		# y_matrix: the data that was fitted (each fit is scaled by its row's value at si)
+		# returns a (rows x n_forecast) matrix; rows without a fit over r_thresh (or one that overflows) keep their last value
+		y_matrix = np.asarray(y_matrix)
+		n, size = y_matrix.shape
+		last = y_matrix[:, -1] if size > 0 else np.zeros(n, dtype = int)
+		si = np.maximum(table['si'], 0)
+		x = size + np.arange(n_forecast)[np.newaxis, :] - si[:, np.newaxis] # days since si
+		with np.errstate(over = 'ignore', invalid = 'ignore'):
+			f = type(self).equation(x, table['a'][:, np.newaxis], table['b'][:, np.newaxis], table['c'][:, np.newaxis])
+			f = np.rint(f * y_matrix[np.arange(n), si][:, np.newaxis] if size > 0 else f)
+			ok = (table['rsqd'] > r_thresh) & np.isfinite(f).all(axis = 1) & (np.abs(f) < 2 ** 53).all(axis = 1)
+		return np.where(ok[:, np.newaxis], f, last[:, np.newaxis]).astype(np.int64)
+	
+	def forecastWorld(self, world, labels = ['CONFIRMED'], n_forecast = 7, r_thresh = 0.80, processes = 1):
+		# forecasts of every area of the world: the areas' own series (the raw data) are fitted (calculateMatrix, memoized)
+		# and evaluated forward (forecastMatrix), then rolled up through the hierarchy as the totals are (World.rollupMatrix)
+		# returns {label: (areas x n_forecast) matrix, one row per world row (area.row())}
+		keys = {area.row(): area.key() for area in world.exportAreas()}
+		forecasts = {}
+		for label in labels:
+			own = np.zeros((world.numRows(), n_forecast), dtype = np.int64)
+			mask = world.getDataMask(label)
+			if mask is not None: 
+				rows = np.flatnonzero(mask[:world.numRows()])
+				y_matrix = world.getDataMatrix(label)[rows]
+				table, fits = self.calculateMatrix(world.getDates(), y_matrix, [keys[i] for i in rows], label, \
+					r_thresh = r_thresh, processes = processes)
+				own[rows] = self.forecastMatrix(table, y_matrix, n_forecast, r_thresh)
+			forecasts[label] = world.rollupMatrix(own)
+		return forecasts
+	
+	def fit(self, x_data, y_data, key = None):
+		# (popt, rsqd, error) of a curve fit of the normalized series, error is None or the exception's name
+		try:
+			popt, pcov, perr, rsqd = self.fitWrapper(x_data, y_data, self.startParams(x_data, y_data, key))
+			if (rsqd < -1): rsqd = -1
+			return popt, round(rsqd, 3), None
+		except (RuntimeError, TypeError, IndexError) as e:
+			return None, -1, type(e).__name__
+	
+	def startParams(self, x_data, y_data, key = None):
+		# p0 of a fit: the series' last parameters, or the model's estimate
+		if not self.warm: return None
+		if key in self.last: return self.last[key]
+		if len(x_data) < 2: return None
+		return self.estimateParams(x_data, y_data)
+	
 	@staticmethod
+	@abstractmethod
 	def equation(x, a, b, c):
-		y = a * np.exp(b * x) + c
-		return y
+		# y of the model's curve at x (arrays broadcast), for curve_fit
+		pass
+	
+	def estimateParams(self, x_data, y_data):
+		# p0 of a fit from the series itself, None for curve_fit's default
+		return None
 	
-	def fitWrapper(self, x_data, y_data):
-		popt, pcov = curve_fit(Model_T1.equation, x_data, y_data, method='dogbox', maxfev=2000)
+	def digest(self, y_data, y_thresh):
+		# hash of a fit's input: the model, its start, the threshhold and the series
+		h = hashlib.sha1((self.a['type'] + '|' + str(self.warm) + '|' + str(y_thresh) + '|').encode('utf-8'))
+		h.update(np.ascontiguousarray(y_data, dtype = '<f8').tobytes())
+		return h.hexdigest()
+	
+	def loadCache(self, filename):
+		# memoized fits and last parameters of an earlier run (see saveCache)
+		with open(filename) as f:
+			state = json.load(f)
+		if state['type'] != self.a['type']: raise ModelError('loadCache', 'Cache of model ' + state['type'] + ' in ' + filename)
+		for digest, (popt, rsqd, error) in state['fits'].items():
+			self.cache[digest] = (np.array(popt) if popt != None else None, rsqd, error)
+		for key, popt in state['last'].items():
+			self.last[key] = np.array(popt)
+		self.used = set()
+	
+	def saveCache(self, filename):
+		# fits used since the cache was loaded (so yesterday's fits of changed series are dropped) and all last parameters
+		state = {'type': self.a['type'], 'fits': {}, 'last': {key: list(popt) for key, popt in self.last.items()}}
+		for digest in self.used:
+			popt, rsqd, error = self.cache[digest]
+			state['fits'][digest] = [list(popt) if popt is not None else None, rsqd, error]
+		with open(filename, 'w') as f:
+			json.dump(state, f)
+	
+	def fitWrapper(self, x_data, y_data, p0 = None):
+		popt, pcov = curve_fit(self.equation, x_data, y_data, p0 = p0, method='dogbox', maxfev=2000)
 		temp = np.diag(pcov)
 		perr = None
 		#if (temp.all() > 0.0001): perr = np.sqrt(np.diag(pcov))
 		# residual sum of squares
-		residuals = y_data - Model_T1.equation(x_data, *popt)
+		residuals = y_data - self.equation(x_data, *popt)
 		ss_res = np.sum(residuals**2)
 		# total sum of squares
 		ss_tot = np.sum((y_data-np.mean(y_data))**2)
@@ -157,7 +386,88 @@ class Model_T1(Model):
 		return popt, pcov, perr, rsqd
 	
 	def resetStats(self, size_estimate = 100, label_list = ['DEFAULT']):
-		self.stats_i = 0 # index
-		for label in label_list:
-			self.a[label] = np.zeros((size_estimate, 4)) # float / columns = rsqd, a, b, c
-			self.a[label][:] = np.nan # fill all as NaN
\ No newline at end of file
+		# stats of all labels are rows of one results store (label_list is not needed, the label is a column)
+		self.results = FitResults(size_estimate)
+
+# exponential: a * e^(b * x) + c
+class Model_T1(Model):
+	
+	def __init__(self, warm = True):
+		super().__init__('T1', warm)
+	
+	@staticmethod
+	def equation(x, a, b, c):
+		y = a * np.exp(b * x) + c
+		return y
+	
+	def estimateParams(self, x_data, y_data):
+		# a, b of log(y) = log(a) + b * x (least squares) and c = 0
+		b, log_a = np.polyfit(x_data, np.log(np.maximum(y_data, 1e-6)), 1)
+		return [np.exp(log_a), b, 0.0]
+
+# logistic: a / (1 + e^(-b * (x - c))), levels off at a
+class Model_T2(Model):
+	
+	def __init__(self, warm = True):
+		super().__init__('T2', warm)
+	
+	@staticmethod
+	def equation(x, a, b, c):
+		y = a / (1 + np.exp(-b * (x - c)))
+		return y
+	
+	def estimateParams(self, x_data, y_data):
+		# a half again the largest value, c where the series passes half of a
+		a = 1.5 * max(np.max(y_data), 1e-6)
+		return [a, 0.1, float(x_data[np.argmin(np.abs(y_data - a / 2))])]
+
+# Gompertz: a * e^(-b * e^(-c * x)), levels off at a (slower than it grows)
+class Model_T3(Model):
+	
+	def __init__(self, warm = True):
+		super().__init__('T3', warm)
+	
+	@staticmethod
+	def equation(x, a, b, c):
+		y = a * np.exp(-b * np.exp(-c * x))
+		return y
+	
+	def estimateParams(self, x_data, y_data):
+		# a half again the largest value, b so the curve starts at the first value
+		a = 1.5 * max(np.max(y_data), 1e-6)
+		return [a, np.log(a / max(y_data[0], 1e-6)), 0.05]
+
+# models by name (see bestFits)
+MODELS = {
+	'exponential': Model_T1,
+	'logistic': Model_T2,
+	'gompertz': Model_T3
+}
+
+def bestFits(d_data, y_matrix, keys = None, label = 'DEFAULT', models = None, r_thresh = 0.80, y_thresh = 1, processes = 1):
+	# fit each row of y_matrix with each model (calculateMatrix) and keep the fit with the best r-squared of each row
+	# models: {name: model} (default a new model of each of MODELS), e.g. with their caches loaded
+	# returns the best fits' results table (FIT_DTYPE), the name of each row's best model ('' if no model fitted the row)
+	# and each model's results table by name; ties go to the first model
+	if models is None: models = {name: cls() for name, cls in MODELS.items()}
+	tables = {}
+	for name, model in models.items():
+		tables[name], fits = model.calculateMatrix(d_data, y_matrix, keys, label, r_thresh = r_thresh, y_thresh = y_thresh, \
+			processes = processes)
+	names = list(tables.keys())
+	fitted = np.array([(tables[name]['error'] == '') & ~np.isnan(tables[name]['a']) for name in names]) # models x rows
+	rsqd = np.where(fitted, np.nan_to_num([tables[name]['rsqd'] for name in names], nan = -np.inf), -np.inf)
+	best = np.argmax(rsqd, axis = 0)
+	table = np.array([tables[names[j]][i] for i, j in enumerate(best)], dtype = FIT_DTYPE)
+	return table, np.where(fitted.any(axis = 0), np.array(names)[best], ''), tables
+
+def _fitRows(task):
+	# memoized fits of a block of rows (see Model.calculateMatrix) and the number of fits run
+	cls, warm, last, d_data, rows, keys, options = task
+	model = cls(warm)
+	model.last = last
+	with warnings.catch_warnings(), np.errstate(over = 'ignore'):
+		warnings.simplefilter('ignore') # thousands of covariance and overflow warnings otherwise
+		for y_data, key in zip(rows, keys):
+			model.calculate(d_data, y_data, None, key = key, **options)
+	return model.cache, model.n_fits
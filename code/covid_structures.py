@@ -4,10 +4,21 @@
 # Purpose: Core class structures for JHU CSSE's Time Series Data Files
 #
 import numpy as np
-import shapefile
 from datetime import datetime
 from datetime import timedelta
 import pickle
+import json
+import struct
+import hashlib
+import os
+
+import covid_export as ce
+
+# binary world cache: magic, version, header length, json header, 64 byte aligned arrays
+CACHE_MAGIC = b'CVWORLD\0'
+CACHE_VERSION = 1
+CACHE_ALIGN = 64
+CACHE_DTYPES = ['<i4', '<i8', '|b1'] # the only dtypes accepted on load
 
 class Error(Exception):
 	"""Base class for exceptions in this module."""
@@ -57,28 +68,39 @@ class Area(Place):
 		self.a['fips'] = 'N/A'
 		self.world = None
 		self.__s = {} # subordinate areas; no dupes possible
-		self.__t = {} # total data for data type, includes self and subordinates
+		self.__i = None # row of this area in the world's data matrices (None until attached)
+		self.__d = None # raw data for data type, only used when not attached to a world
+		self.__t = None # total data for data type, only used when not attached to a world
 	
 	def areaFactory(self, name, lat=0.0, lon=0.0): 
 		# factory class
-		if (name in self.__s): return self.__s[name]
+		if (name in self.__subs()): return self.__s[name]
 		ar = Area(self, name, lat, lon)
 		if (type(ar) != Area): raise TypeError('Area added not of type \'Area\'')
 		if (self.a['level'] == -1): raise UsageError('Parent level not set.')
 		ar.a['level'] = self.a['level'] + 1
 		ar.world = self.world
+		ar.attach()
 		if (ar.a['level'] > 1): ar.a['key'] = name + ', ' + self.a['key']
 		self.__s[ar.name()] = ar
+		self.world.indexArea(ar)
+		self.world.invalidate(ar) # new subordinate; totals up the hierarchy are dirty
 		return ar
 		
+	def attach(self):
+		# reserve a row in the world's data matrices; the area then only holds its row index
+		if (self.world == None): raise UsageError('World not set.')
+		if (self.__i == None): self.__i = self.world.addRow(self)
+		return self.__i
+		
 	def areas(self):
-		for k in sorted(self.__s.keys()):
+		for k in sorted(self.__subs().keys()):
 			yield self.__s.get(k)
 	
 	def debug(self):
 		for k in self.a:
 			print('A' + str(self.a['level']) + ': ' + str(k) + ':' + str(self.a[k]))
-		for k in self.__s:
+		for k in self.__subs():
 			print('S' + str(self.a['level']) + ': ' + str(k) + ':' + str(self.__s[k]))
 	
 	def getList4ShapefileExport(self, area, data, n = 1, t = '?'):
@@ -87,68 +109,87 @@ class Area(Place):
 		return list
 	
 	def getArea(self, name):
-		if (name in self.__s): return self.__s[name]
+		if (name in self.__subs()): return self.__s[name]
 		return None
 	
 	def getAreas(self):
+		return self.__subs()
+	
+	def __subs(self):
+		# subordinate areas, built first if the world was loaded lazily (see World.expand)
+		if self.__s == None: self.world.expand(self)
 		return self.__s
 	
 	def getData(self, label, thresh = 0, recalculate = False, ignore = False):
 		# ignore parameter => ignore "unassigned", "out of", in a recalc
-		# print('=================')
-		# print('s.getData()', self.a['name'], label, self.world.lenData())
-		# self.debug()
-		# print('=================')
-		if label not in self.__t or recalculate:
-			self.__t[label] = np.zeros(self.world.lenData(), dtype = int)
-			if (label in self.a): self.__t[label] += self.a[label]
-			for a in self.areas(): # next level, e.g. 2 or 3, if it exists
-				temp = a.getData(label, thresh, recalculate, ignore)
-				#print('>>>', temp)
-				if type(temp) == np.ndarray:
-					if ignore == False or (a.name().startswith('Unassigned') == False and a.name().startswith('Out of') == False): 
-						self.__t[label] += temp
-				#a.debug()
-				#print('-------------------------------------')
+		# returns a view into the world's total matrix (one row per area)
+		if self.__i == None: 
+			total = self.__getLocalData(label, recalculate, ignore)
+		else:
+			if recalculate: 
+				self.world.rollup(label, ignore, self)
+			elif not self.world.getTotalMask(label)[self.__i]: 
+				self.world.rollup(label, ignore, self, dirty = True) # only areas changed since the last calculation
+			total = self.world.getTotalMatrix(label)[self.__i]
 		# shift via thresh?
 		if thresh > 0:
-			i = np.argmax(self.__t[label] >= thresh) # index of first occurrence greater than thresh
-			#print(self.__t[label], thresh, i)
-			return self.__t[label][i:] # return slice starting from there
-		return self.__t[label]
+			i = np.argmax(total >= thresh) # index of first occurrence greater than thresh
+			return total[i:] # return slice starting from there
+		return total
 	
 	def getDataThreshI(self, label, thresh = 0, recalculate = False, ignore = False):
-		#print('=================')
-		#print('s.getData()', self.a['name'], label, self.world.lenData())
-		#self.debug()
-		#print('=================')
-		if label not in self.__t or recalculate:
-			self.__t[label] = np.zeros(self.world.lenData(), dtype = int)
-			if (label in self.a): self.__t[label] += self.a[label]
-			for a in self.areas(): # next level, e.g. 2 or 3, if it exists
-				temp = a.getData(label, thresh, recalculate, ignore)
-				#print('>>>', temp)
-				if type(temp) == np.ndarray:
-					if ignore == False or (a.name().startswith('Unassigned') == False and a.name().startswith('Out of') == False): 
-						self.__t[label] += temp
-				#a.debug()
-				#print('-------------------------------------')
+		total = self.getData(label, 0, recalculate, ignore)
 		# shift via thresh?
 		if thresh > 0:
-			i = np.argmax(self.__t[label] >= thresh) # index of first occurrence greater than thresh
+			i = np.argmax(total >= thresh) # index of first occurrence greater than thresh
 			return i # return slice starting from there
 		return 0
 	
+	def rollupRecursive(self, label, ignore = False):
+		# recursive (one area at a time) version of World.rollup for this area and its subordinates
+		total = self.world.getTotalMatrix(label)[self.__i]
+		total[:] = 0
+		if self.hasData(label): total += self.getRawData(label)
+		for a in self.areas(): # next level, e.g. 2 or 3, if it exists
+			temp = a.rollupRecursive(label, ignore)
+			if ignore == False or (a.name().startswith('Unassigned') == False and a.name().startswith('Out of') == False): 
+				total += temp
+		self.world.getTotalMask(label)[self.__i] = True
+		return total
+	
+	def __getLocalData(self, label, recalculate, ignore):
+		# totals for an area outside of a world's matrices, e.g. generated guides
+		if self.__t == None: self.__t = {}
+		if label not in self.__t or recalculate:
+			self.__t[label] = np.zeros(self.world.lenData(), dtype = int)
+			if self.hasData(label): self.__t[label] += self.getRawData(label)
+			for a in self.areas():
+				temp = a.getData(label, 0, recalculate, ignore)
+				if ignore == False or (a.name().startswith('Unassigned') == False and a.name().startswith('Out of') == False): 
+					self.__t[label] += temp
+		return self.__t[label]
+	
 	def getParent(self):
 		return self.__parent
 	
 	def hasAreas(self):
-		if (len(self.__s) > 0): return True
+		if (len(self.__subs()) > 0): return True
 		return False
 	
+	def getRawData(self, label):
+		# data set on this area itself (no subordinates), or None
+		if self.__i == None: 
+			if self.__d == None: return None
+			return self.__d.get(label)
+		mask = self.world.getDataMask(label)
+		if mask is None or not mask[self.__i]: return None
+		return self.world.getDataMatrix(label)[self.__i]
+	
 	def hasData(self, label):
-		if (label in self.a): return True
-		return False
+		if self.__i == None: return self.__d != None and label in self.__d
+		mask = self.world.getDataMask(label)
+		if mask is None: return False
+		return bool(mask[self.__i])
 	
 	def key(self):
 		return self.a['key']
@@ -160,48 +201,75 @@ class Area(Place):
 		return self.a['name']
 	
 	def numAreas(self):
-		return len(self.__s)
+		return len(self.__subs())
+	
+	def row(self):
+		return self.__i
+	
+	def setFIPS(self, fips):
+		# set the FIPS attribute and keep the world's FIPS index current
+		if self.world != None and self.__i != None: self.world.indexFIPS(self, fips)
+		self.a['fips'] = fips
 	
 	def setData(self, label, data, smooth = True):
 		c_fixes = 0
 		if smooth: c_fixes = Area.smooth(data)
-		self.a[label] = data
+		if self.__i == None:
+			if self.__d == None: self.__d = {}
+			self.__d[label] = data
+			if self.__t != None: self.__t.pop(label, None)
+			return c_fixes
+		if (len(data) != self.world.lenData()): 
+			raise UsageError('setData', 'Data length ' + str(len(data)) + ' != ' + str(self.world.lenData()))
+		self.world.getDataMatrix(label, True)[self.__i] = data
+		self.world.getDataMask(label)[self.__i] = True
+		self.world.invalidate(self, label)
 		return c_fixes
 	
 	@staticmethod
 	def smooth(data):
-		c_fixes = 0
+		# single series version of smoothMatrix, data is fixed in place
+		if type(data) == np.ndarray:
+			return int(Area.smoothMatrix(data.reshape(1, -1))[0])
+		temp = np.array(data)
+		c_fixes = int(Area.smoothMatrix(temp.reshape(1, -1))[0])
+		data[:] = temp.tolist()
+		return c_fixes
+	
+	@staticmethod
+	def smoothMatrix(m):
+		# smooths every row (series) of a 2D (areas x dates) matrix in place, returns number of fixes per row
+		# each pass tests all positions against the values at the start of the pass; a fixed position is never
+		# a neighbor of another fix in the same pass, so this matches a left to right scan exactly
+		c_fixes = np.zeros(m.shape[0], dtype = int)
+		if m.shape[1] < 3: return c_fixes
+		a = m[:, :-2] # left neighbor
+		b = m[:, 1:-1] # position being fixed
+		c = m[:, 2:] # right neighbor
 		# phase 1 (internal holes, until no more fixes)
 		# smooth out holes [31, 71, 77, 0, 102] -> [31, 71, 77, 90, 102]
 		while (True):
-			n_fixes = 0
-			for i in range(len(data)-2):
-				if data[i] > 0 and data[i+1] == 0 and data[i+2] > 0:
-					data [i+1] = int(round((data[i] + data[i+2]) / 2.0, 0))
-					c_fixes += 1
-					n_fixes += 1
-			if n_fixes == 0: break
+			fix = (a > 0) & (b == 0) & (c > 0)
+			if not fix.any(): break
+			b[fix] = np.rint((a[fix] + c[fix]) / 2.0)
+			c_fixes += fix.sum(axis = 1)
 		# phase 2 (once, leading edge) [0, 0, 22] -> [0, 11, 22]
-		for i in range(len(data)-2):
-			if data[i] == 0 and data[i+1] == 0 and data[i+2] > 0:
-				data [i+1] = int(round((data[i] + data[i+2]) / 2.0, 0))
-				c_fixes += 1
+		fix = (a == 0) & (b == 0) & (c > 0)
+		b[fix] = np.rint((a[fix] + c[fix]) / 2.0)
+		c_fixes += fix.sum(axis = 1)
 		# phase 3 (internal negative adjustments; probably corrections to reported data, but we can smooth out)
 		# [358 349 373] -> [358 365 373] # this is number of deaths in VA in the raw data and it's a cummulative total, so
 		# this correction makes sense
 		while (True):
-			n_fixes = 0
-			for i in range(len(data)-2):
-				if data[i] > data[i+1] and data[i+2] > data[i] and data[i+2] > data[i+1]:
-					data [i+1] = int(round((data[i] + data[i+2]) / 2.0, 0))
-					c_fixes += 1
-					n_fixes += 1
-			if n_fixes == 0: break
+			fix = (a > b) & (c > a) & (c > b)
+			if not fix.any(): break
+			b[fix] = np.rint((a[fix] + c[fix]) / 2.0)
+			c_fixes += fix.sum(axis = 1)
 		# return
 		return c_fixes
 	
 	def __str__(self):
-		s = self.a['name'] + '[' + str(self.a['level']) + ':' + str(len(self.__s)) + ']'
+		s = self.a['name'] + '[' + str(self.a['level']) + ':' + str(len(self.__subs())) + ']'
 		return s
 
 # world root area, which has no parent
@@ -212,232 +280,251 @@ class World(Area):
 		self.a['level'] = 0
 		self.a['fips'] = 'N/A'
 		self.__dates = [] # date data
+		self.__n = 0 # rows in use, one per area
+		self.__cap = 0 # rows allocated
+		self.__data = {} # raw data matrix (areas x dates) per data type
+		self.__hasdata = {} # raw data set flags (areas) per data type
+		self.__total = {} # total matrix (areas x dates) per data type, includes self and subordinates
+		self.__valid = {} # total calculated flags (areas) per data type
+		self.__rows = {} # hierarchy per row: parent row (-1 for the world), level, ignorable ("unassigned", "out of")
+		self.__plan = None # rows grouped by level and sorted by parent for rollups, rebuilt as areas are added
+		self.__keys = {} # index of all areas in the hierarchy by key
+		self.__fips = {} # index of all areas in the hierarchy by FIPS
+		self.__lazy = None # hierarchy table of a lazily loaded cache, until all countries are built (see expand)
 		self.world = self
-	
-	def dump(self, filename):
+		self.attach() # row 0
+		self.indexArea(self)
+	
+	def __getstate__(self):
+		# pickle only the used rows and the raw data; totals are recalculated on demand
+		self.expand()
+		state = self.__dict__.copy()
+		n = self.__n
+		state['_World__cap'] = n
+		state['_World__data'] = {label: m[:n].copy() for label, m in self.__data.items()}
+		state['_World__hasdata'] = {label: m[:n].copy() for label, m in self.__hasdata.items()}
+		state['_World__total'] = {}
+		state['_World__valid'] = {}
+		state['_World__rows'] = {k: m[:n].copy() for k, m in self.__rows.items()}
+		state['_World__plan'] = None
+		state['_World__keys'] = None # indexes are rebuilt on load
+		state['_World__fips'] = None
+		return state
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.__lazy = None
+		if '_World__data' not in state: self.__upgrade() # cache written before matrix storage
+		self.__keys = {}
+		self.__fips = {}
+		areas = [self]
+		while len(areas) > 0:
+			ar = areas.pop()
+			self.indexArea(ar)
+			areas.extend(ar.getAreas().values())
+	
+	def __upgrade(self):
+		# move per area arrays (area.a[label]) of an older cache into the world's matrices
+		self.__n = 0
+		self.__cap = 0
+		self.__data = {}
+		self.__hasdata = {}
+		self.__total = {}
+		self.__valid = {}
+		self.__rows = {}
+		self.__plan = None
+		areas = [self]
+		while len(areas) > 0:
+			ar = areas.pop()
+			ar._Area__i = None
+			ar._Area__d = None
+			ar._Area__t = None
+			ar.attach()
+			for label in [k for k, v in ar.a.items() if type(v) == np.ndarray]:
+				ar.setData(label, ar.a.pop(label), False)
+			areas.extend(ar.getAreas().values())
+	
+	def addRow(self, area):
+		# new row (zeros) in all data matrices, grown by doubling
+		if (self.__n == self.__cap):
+			self.__cap = max(16, 2 * self.__cap)
+			if len(self.__rows) == 0: 
+				self.__rows = {'parent': np.zeros(0, dtype = int), 'level': np.zeros(0, dtype = int), \
+					'ignore': np.zeros(0, dtype = bool)}
+			for d in [self.__data, self.__hasdata, self.__total, self.__valid, self.__rows]:
+				for label, m in d.items():
+					temp = np.zeros((self.__cap,) + m.shape[1:], dtype = m.dtype)
+					temp[:self.__n] = m[:self.__n]
+					d[label] = temp
+		i = self.__n
+		parent = area.getParent()
+		self.__rows['parent'][i] = -1 if parent == None else parent.row()
+		self.__rows['level'][i] = area.level()
+		self.__rows['ignore'][i] = area.name().startswith('Unassigned') or area.name().startswith('Out of')
+		self.__plan = None
+		self.__n += 1
+		return i
+	
+	def dump(self, filename, binary = None):
+		# binary: versioned numpy cache (see load), else pickle; by default only '.p' files are pickled
+		if binary == None: binary = not filename.endswith('.p')
 		print('Saving World Cache [' + filename + ']...')
-		pickle.dump(self, open(filename, 'wb'))
-	
-	def exportShapefile(self, filename):
-		print('Exporting Shapefile [' + filename + ']...')
-		w = shapefile.Writer(filename, shapefile.POINT)
-		w.autoBalance = 1
-		n = 0
-		d = {} # data
-		# create header
-		dates = {} # dates
-		d['DA'] = self.getDates()
-		w.field('N','N')
-		w.field('FIPS','C','5')
-		w.field('ADM3','C','80')
-		w.field('ADM2','C','80')
-		w.field('ADM1','C','80')
-		w.field('KEY','C','255')
-		w.field('LAT','N',decimal=6)
-		w.field('LON','N',decimal=6)
-		w.field('T','C','1')
-		for i in range(self.lenData()):
-			dates[i] = d['DA'][i].strftime('%m/%d/%Y')
-			w.field(dates[i], 'N')
-		# proceed
-		d['C'] = self.getData('CONFIRMED')
-		d['D'] = self.getData('DEATHS')
-		d['R'] = self.getData('RECOVERED')
-		for t in ['C','D','R']: # area itself
-			n += 1
-			w.point(self.a['lon'], self.a['lat'])
-			w.record(*self.getList4ShapefileExport(self, d[t], n, t))
-		for s1 in self.areas():
-			d['C'] = s1.getData('CONFIRMED')
-			d['D'] = s1.getData('DEATHS')
-			d['R'] = s1.getData('RECOVERED')
-			for t in ['C','D','R']:
-				n += 1
-				w.point(s1.a['lon'], s1.a['lat'])
-				w.record(*s1.getList4ShapefileExport(s1, d[t], n, t))
-			for s2 in s1.areas():
-				d['C'] = s2.getData('CONFIRMED')
-				d['D'] = s2.getData('DEATHS')
-				d['R'] = s2.getData('RECOVERED')
-				for t in ['C','D','R']:
-					n += 1
-					w.point(s2.a['lon'], s2.a['lat'])
-					w.record(*s2.getList4ShapefileExport(s2, d[t], n, t))
-				for s3 in s2.areas():
-					d['C'] = s3.getData('CONFIRMED')
-					d['D'] = s3.getData('DEATHS')
-					d['R'] = s3.getData('RECOVERED')
-					for t in ['C','D','R']:
-						n += 1
-						w.point(s3.a['lon'], s3.a['lat'])
-						w.record(*s3.getList4ShapefileExport(s3, d[t], n, t))
-		# write the file
-		w.close()
-		# create the PRJ file
-		prj = open("%s" % filename.replace('.shp','.prj'), "w")
-		epsg = 'GEOGCS["WGS 84",'
-		epsg += 'DATUM["WGS_1984",'
-		epsg += 'SPHEROID["WGS 84",6378137,298.257223563]]'
-		epsg += ',PRIMEM["Greenwich",0],'
-		epsg += 'UNIT["degree",0.0174532925199433]]'
-		prj.write(epsg)
-		prj.close()
+		if binary:
+			self.__dumpBinary(filename)
+		else:
+			pickle.dump(self, open(filename, 'wb'))
+	
+	def __dumpBinary(self, filename):
+		# areas in depth first order (parent before subordinates), which becomes the row order on load
+		order = []
+		stack = [self]
+		while len(stack) > 0:
+			ar = stack.pop()
+			order.append(ar)
+			stack.extend(reversed(list(ar.areas())))
+		index = {id(ar): i for i, ar in enumerate(order)}
+		rows = np.array([ar.row() for ar in order], dtype = int)
+		meta = {'version': CACHE_VERSION, 'name': self.name(), 'length': self.lenData(), \
+			'start': self.__dates[0].isoformat() if self.lenData() > 0 else None, 'areas': {}, 'arrays': {}}
+		meta['areas']['parent'] = [-1] + [index[id(ar.getParent())] for ar in order[1:]]
+		for k in ['name', 'lat', 'lon', 'fips', 'adm1', 'adm2', 'adm3']:
+			meta['areas'][k] = [ar.a[k] for ar in order]
+		arrays = []
+		for label in sorted(self.__data.keys()):
+			# raw data only, totals are recalculated on demand after loading (as for the pickle); they would double the file
+			m = self.getDataMatrix(label)[rows]
+			fits = len(m) == 0 or (m.min() >= np.iinfo(np.int32).min and m.max() <= np.iinfo(np.int32).max)
+			arrays.append(('data/' + label, m.astype('<i4' if fits else '<i8')))
+			arrays.append(('mask/' + label, self.getDataMask(label)[rows]))
+		offset = 0
+		for name, m in arrays:
+			meta['arrays'][name] = {'dtype': m.dtype.str, 'shape': list(m.shape), 'offset': offset}
+			offset += -(-m.nbytes // CACHE_ALIGN) * CACHE_ALIGN
+		header = json.dumps(meta, separators = (',', ':')).encode('utf-8')
+		with open(filename, 'wb') as f:
+			f.write(CACHE_MAGIC + struct.pack('<II', CACHE_VERSION, len(header)) + header)
+			base = -(-(len(CACHE_MAGIC) + 8 + len(header)) // CACHE_ALIGN) * CACHE_ALIGN
+			f.write(b'\0' * (base - f.tell()))
+			for name, m in arrays:
+				f.write(np.ascontiguousarray(m).tobytes())
+				f.write(b'\0' * (base + meta['arrays'][name]['offset'] + -(-m.nbytes // CACHE_ALIGN) * CACHE_ALIGN - f.tell()))
+	
+	def export(self, targets, processes = 1, manifest = False):
+		# write several export formats in a single walk of the hierarchy
+		# targets: [(format, filename)] with formats from covid_export.WRITERS ('standard', 'transposed', 'pgis', 'pgcopy', 'shapefile', 'sqlite', 'forecast'),
+		#   or [(format, filename, options)] with writer options, e.g. {'compress': 'gzip', 'chunk': 100000000, 'append': True}
+		#   or {'partition': 'month'} (formats with partitions);
+		#   a format listed more than once (with the same options) is written once and then copied to the other filenames
+		# processes: write each format in country partitions on this many processes (same files as a single process)
+		# manifest: skip targets whose files are as left by the last export and whose data did not change since,
+		#   by the fingerprints in the manifest next to them (covid_export.MANIFEST); returns the skipped filenames
+		writers = []
+		copies = []
+		skipped = []
+		if manifest: 
+			fingerprint = self.fingerprint()
+			manifests = {}
+			for target in targets:
+				directory = os.path.dirname(os.path.abspath(target[1]))
+				if directory not in manifests: 
+					manifests[directory] = ce.readManifest(directory)
+					if 'areas' in manifests[directory]: 
+						old = manifests[directory]['areas']
+						changed = [key for key, h in fingerprint['areas'].items() if old.get(key) != h]
+						print('Changed since the last export [' + directory + ']: ' + str(len(changed)) + ' of ' + \
+							str(len(fingerprint['areas'])) + ' areas, labels ' + \
+							str([l for l, h in fingerprint['labels'].items() if manifests[directory]['labels'].get(l) != h]))
+		for target in targets:
+			format, filename = target[:2]
+			options = target[2] if len(target) > 2 else {}
+			if format not in ce.WRITERS: raise UsageError('export', 'Unknown export format ' + format)
+			if options.get('compress') not in [None] + list(ce.COMPRESSION.keys()): 
+				raise UsageError('export', 'Unknown compression ' + str(options['compress']))
+			if options.get('partition') != None and options['partition'] not in ce.WRITERS[format].partitions: 
+				raise UsageError('export', 'Can not partition ' + format + ' export by ' + str(options['partition']))
+			w = ce.WRITERS[format](self, filename, **options)
+			if w.append and (not w.appendable or w.chunk > 0): raise UsageError('export', 'Can not append to ' + format + ' export ' + filename)
+			if manifest and w.unchanged(manifests[os.path.dirname(os.path.abspath(filename))], filename, fingerprint): 
+				print('Unchanged, skipped [' + filename + ']')
+				skipped.append(filename)
+				continue
+			first = [f for f in writers if type(f) == type(w) and f.settings() == w.settings()]
+			if len(first) > 0: 
+				copies.append((first[0], filename))
+			else:
+				writers.append(w)
+		if processes > 1:
+			ce.exportParallel(self, writers, processes)
+		else:
+			ce.writeAreas(writers, self.exportAreas())
+		for w, filename in copies:
+			w.copyTo(filename)
+		if manifest: 
+			for w, filename in [(w, w.filename) for w in writers] + copies:
+				w.record(manifests[os.path.dirname(os.path.abspath(filename))], filename, fingerprint)
+			for directory, m in manifests.items():
+				m.update(fingerprint)
+				ce.writeManifest(directory, m)
+			print('Skipped ' + str(len(skipped)) + ' of ' + str(len(targets)) + ' exports (unchanged)')
+		return skipped
+	
+	def fingerprint(self):
+		# sha1 of what is exported, per label (all areas in export order, with the dates) and per area (attributes and all labels)
+		labels = {}
+		for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+			labels[label] = hashlib.sha1('|'.join([da.strftime('%Y-%m-%d') for da in self.__dates]).encode('utf-8'))
+		areas = {}
+		for area in self.exportAreas():
+			a = '|'.join([area.a['fips'], area.a['adm3'], area.a['adm2'], area.a['adm1'], area.a['key'], \
+				str(area.a['lat']), str(area.a['lon'])]).encode('utf-8') + b'\n'
+			h = hashlib.sha1(a)
+			for label, lh in labels.items():
+				b = np.ascontiguousarray(area.getData(label), dtype = '<i8').tobytes()
+				h.update(b)
+				lh.update(a)
+				lh.update(b)
+			areas[area.a['key']] = h.hexdigest()
+		return {'labels': {label: h.hexdigest() for label, h in labels.items()}, 'areas': areas}
+	
+	def exportAreas(self, countries = None, world = True):
+		# areas in export order: the world, then each level in name order down to ADM3
+		# countries: only the subtrees of these countries (names, in this order); world: include the world itself
+		if world: yield self
+		for c in (self.areas() if countries == None else [self.getArea(name) for name in countries]):
+			stack = [c]
+			while len(stack) > 0:
+				area = stack.pop()
+				yield area
+				if area.level() < 3: stack.extend(reversed(list(area.areas())))
+	
+	def exportShapefile(self, filename, partition = None, processes = 1):
+		# partition: 'month' or 'adm1', one shapefile per month or country and a manifest of them (see covid_export.ShapefileWriter)
+		self.export([('shapefile', filename, {'partition': partition})], processes)
 	
 	def exportStandard(self, filename):
-		print('Exporting (Standard) World [' + filename + ']...')
-		fileout = open(filename,'w')
-		n = 0
-		d = {} # data
-		d['DA'] = self.getDates()
-		s = 'N|FIPS|ADM3|ADM2|ADM1|KEY|LAT|LON|T'
-		for i in range(self.lenData()):
-			s += '|' + d['DA'][i].strftime('%m/%d/%Y')
-		fileout.write(s + '\n')
-		d['C'] = self.getData('CONFIRMED')
-		d['D'] = self.getData('DEATHS')
-		d['R'] = self.getData('RECOVERED')
-		for t in ['C','D','R']:
-			n += 1
-			s = str(n) + '|' + self.a['fips'] + '|N/A|N/A|N/A|' + self.a['key'] + '|' + str(self.a['lat']) + '|' + \
-				str(self.a['lon']) + '|' + t
-			for i in range(self.lenData()):
-				s += '|' + str(d[t][i])
-			fileout.write(s + '\n')
-		for s1 in self.areas():
-			d['C'] = s1.getData('CONFIRMED')
-			d['D'] = s1.getData('DEATHS')
-			d['R'] = s1.getData('RECOVERED')
-			for t in ['C','D','R']:
-				n += 1
-				s = str(n) + '|' + s1.a['fips'] + '|' + s1.a['adm3'] + '|' + s1.a['adm2'] + '|' + s1.a['adm1'] + '|' + \
-					s1.a['key'] + '|' + str(s1.a['lat']) + '|' + str(s1.a['lon']) + '|' + t
-				for i in range(self.lenData()):
-					s += '|' + str(d[t][i])
-				fileout.write(s + '\n')
-			for s2 in s1.areas():
-				d['C'] = s2.getData('CONFIRMED')
-				d['D'] = s2.getData('DEATHS')
-				d['R'] = s2.getData('RECOVERED')
-				for t in ['C','D','R']:
-					n += 1
-					s = str(n) + '|' + s2.a['fips'] + '|' + s2.a['adm3'] + '|' + s2.a['adm2'] + '|' + s2.a['adm1'] + '|' + \
-						s2.a['key'] + '|' + str(s2.a['lat']) + '|' + str(s2.a['lon']) + '|' + t
-					for i in range(self.lenData()):
-						s += '|' + str(d[t][i])
-					fileout.write(s + '\n')
-				for s3 in s2.areas():
-					d['C'] = s3.getData('CONFIRMED')
-					d['D'] = s3.getData('DEATHS')
-					d['R'] = s3.getData('RECOVERED')
-					for t in ['C','D','R']:
-						n += 1
-						s = str(n) + '|' + s3.a['fips'] + '|' + s3.a['adm3'] + '|' + s3.a['adm2'] + '|' + s3.a['adm1'] + '|' + \
-							s3.a['key'] + '|' + str(s3.a['lat']) + '|' + str(s3.a['lon']) + '|' + t
-						for i in range(self.lenData()):
-							s += '|' + str(d[t][i])
-						fileout.write(s + '\n')
-		fileout.close()
-	
-	def exportTransposed(self, filename):
-		print('Exporting (Transposed) World [' + filename + ']...')
-		fileout = open(filename,'w')
-		n = 0
-		d = {} # data
-		d['DA'] = self.getDates()
-		fileout.write('N|FIPS|ADM3|ADM2|ADM1|DATE|KEY|LAT|LON|CONFIRMED|DEATHS|RECOVERED\n')
-		d['C'] = self.getData('CONFIRMED')
-		d['D'] = self.getData('DEATHS')
-		d['R'] = self.getData('RECOVERED')
-		for i in range(self.lenData()):
-			n += 1
-			s = str(n) + '|' + self.a['fips'] + '|N/A|N/A|N/A|' + d['DA'][i].strftime('%m/%d/%Y') + '|' + self.a['key'] + \
-				'|' + str(self.a['lat']) + '|' + str(self.a['lon']) + '|' + str(d['C'][i]) + '|' + str(d['D'][i]) + \
-				'|' + str(d['R'][i])
-			fileout.write(s + '\n')
-		for s1 in self.areas():
-			d['C'] = s1.getData('CONFIRMED')
-			d['D'] = s1.getData('DEATHS')
-			d['R'] = s1.getData('RECOVERED')
-			for i in range(self.lenData()):
-				n += 1
-				s = str(n) + '|' + s1.a['fips'] + '|' + s1.a['adm3'] + '|' + s1.a['adm2'] + '|' + s1.a['adm1'] + \
-					'|' + d['DA'][i].strftime('%m/%d/%Y') + '|' + s1.a['key'] + '|' + \
-					str(s1.a['lat']) + '|' + str(s1.a['lon']) + '|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-				fileout.write(s + '\n')
-			for s2 in s1.areas():
-				d['C'] = s2.getData('CONFIRMED')
-				d['D'] = s2.getData('DEATHS')
-				d['R'] = s2.getData('RECOVERED')
-				for i in range(self.lenData()):
-					n += 1
-					s = str(n) + '|' + s2.a['fips'] + '|' + s2.a['adm3'] + '|' + s2.a['adm2'] + '|' + s2.a['adm1'] + \
-						'|' + d['DA'][i].strftime('%m/%d/%Y') + '|' + s2.a['key'] + '|' + \
-						str(s2.a['lat']) + '|' + str(s2.a['lon']) + '|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-					fileout.write(s + '\n')
-				for s3 in s2.areas():
-					d['C'] = s3.getData('CONFIRMED')
-					d['D'] = s3.getData('DEATHS')
-					d['R'] = s3.getData('RECOVERED')
-					for i in range(self.lenData()):
-						n += 1
-						s = str(n) + '|' + s3.a['fips'] + '|' + s3.a['adm3'] + '|' + s3.a['adm2'] + '|' + s3.a['adm1'] + \
-							'|' + d['DA'][i].strftime('%m/%d/%Y') + '|' + s3.a['key'] + '|' + \
-							str(s3.a['lat']) + '|' + str(s3.a['lon']) + '|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-						fileout.write(s + '\n')
-		fileout.close()
-	
-	def exportTransposedPGIS(self, filename):
+		self.export([('standard', filename)])
+	
+	def exportTransposed(self, filename, compress = None, chunk = 0, append = False):
+		# compress: 'gzip', 'bz2' or 'lzma' (default by extension: .gz, .bz2, .xz); chunk: max bytes per file (chunks of an earlier export beyond the last are removed)
+		# append: only add the rows of new dates to the earlier export (a full export if anything else changed)
+		self.export([('transposed', filename, {'compress': compress, 'chunk': chunk, 'append': append})])
+	
+	def exportTransposedPGIS(self, filename, compress = None, chunk = 0, append = False, binary = False):
 	# PostGIS COPY Format
-		print('Exporting (Transposed PostGIS COPY Format) World [' + filename + ']...')
-		fileout = open(filename,'w')
-		n = 0
-		d = {} # data
-		d['DA'] = self.getDates()
-		#fileout.write('id|key|date|fips|adm3|adm2|adm1|lat|lon|geom|confirmed|deaths|recovered\n')
-		d['C'] = self.getData('CONFIRMED')
-		d['D'] = self.getData('DEATHS')
-		d['R'] = self.getData('RECOVERED')
-		for i in range(self.lenData()):
-			n += 1
-			s = str(n) + '|' + self.a['key'] + '|' + d['DA'][i].strftime('%Y-%m-%d') + '|' + self.a['fips'] + \
-				'|N/A|N/A|N/A' + \
-				'|' + str(self.a['lat']) + '|' + str(self.a['lon']) + \
-				'|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-			fileout.write(s + '\n')
-		for s1 in self.areas():
-			d['C'] = s1.getData('CONFIRMED')
-			d['D'] = s1.getData('DEATHS')
-			d['R'] = s1.getData('RECOVERED')
-			for i in range(self.lenData()):
-				n += 1
-				s = str(n) + '|' + s1.a['key'] + '|' + d['DA'][i].strftime('%Y-%m-%d') + '|' + s1.a['fips'] + \
-					'|' + s1.a['adm3'] + '|' + s1.a['adm2'] + '|' + s1.a['adm1'] + \
-					'|' + str(s1.a['lat']) + '|' + str(s1.a['lon']) + \
-					'|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-				fileout.write(s + '\n')
-			for s2 in s1.areas():
-				d['C'] = s2.getData('CONFIRMED')
-				d['D'] = s2.getData('DEATHS')
-				d['R'] = s2.getData('RECOVERED')
-				for i in range(self.lenData()):
-					n += 1
-					s = str(n) + '|' + s2.a['key'] + '|' + d['DA'][i].strftime('%Y-%m-%d') + '|' + s2.a['fips'] + \
-						'|' + s2.a['adm3'] + '|' + s2.a['adm2'] + '|' + s2.a['adm1'] + \
-						'|' + str(s2.a['lat']) + '|' + str(s2.a['lon']) + \
-						'|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-					fileout.write(s + '\n')
-				for s3 in s2.areas():
-					d['C'] = s3.getData('CONFIRMED')
-					d['D'] = s3.getData('DEATHS')
-					d['R'] = s3.getData('RECOVERED')
-					for i in range(self.lenData()):
-						n += 1
-						s = str(n) + '|' + s3.a['key'] + '|' + d['DA'][i].strftime('%Y-%m-%d') + '|' + s3.a['fips'] + \
-							'|' + s3.a['adm3'] + '|' + s3.a['adm2'] + '|' + s3.a['adm1'] + \
-							'|' + str(s3.a['lat']) + '|' + str(s3.a['lon']) + \
-							'|' + str(d['C'][i]) + '|' + str(d['D'][i]) + '|' + str(d['R'][i])
-						fileout.write(s + '\n')
-		fileout.close()
+	# binary: PostgreSQL binary COPY format with all columns including geom (compress only, see covid_export.PGCopyWriter)
+		if binary: 
+			self.export([('pgcopy', filename, {'compress': compress})])
+		else:
+			self.export([('pgis', filename, {'compress': compress, 'chunk': chunk, 'append': append})])
+	
+	def exportForecast(self, filename, forecasts, compress = None):
+		# forecasts: {label: (areas x days) matrix by row} for the days after the data, e.g. of covid_models.Model_T1.forecastWorld;
+		# written as the standard export is (one row per area and label)
+		self.export([('forecast', filename, {'compress': compress, 'forecasts': forecasts})])
+	
+	def exportSQLite(self, filename, append = False):
+		# timeseries table of scripts/psql.data.transposed.sql in a SQLite file; append: only insert new dates
+		self.export([('sqlite', filename, {'append': append})])
 	
 	# return array of indices from the dates, e.g. [0, 1, 2, 3, 4...]
 	def getIndexR(self, shift = 0):
@@ -450,18 +537,392 @@ class World(Area):
 	def getDates(self):
 		return self.__dates
 	
+	def getAreaByFIPS(self, fips):
+		# any area in the hierarchy by FIPS code (e.g. '51059'), or None
+		if self.__lazy != None and fips not in self.__fips:
+			row = self.__lazy['fips'].get(fips)
+			if row != None: self.expand(self.__lazy['areas'][self.__lazy['country'][row]])
+		return self.__fips.get(fips)
+	
+	def getAreaByKey(self, key):
+		# any area in the hierarchy by key (e.g. 'Fairfax, Virginia, US'), or None
+		if self.__lazy != None and key not in self.__keys:
+			row = self.__lazy['keys'].get(key)
+			if row != None: self.expand(self.__lazy['areas'][self.__lazy['country'][row]])
+		return self.__keys.get(key)
+	
+	def getAreasByFIPS(self, fips_list):
+		# batch version of getAreaByFIPS, None for unknown codes
+		if self.__lazy != None: return [self.getAreaByFIPS(fips) for fips in fips_list]
+		return [self.__fips.get(fips) for fips in fips_list]
+	
+	def getAreasByKey(self, key_list):
+		# batch version of getAreaByKey, None for unknown keys
+		if self.__lazy != None: return [self.getAreaByKey(key) for key in key_list]
+		return [self.__keys.get(key) for key in key_list]
+	
+	def getDataMask(self, label):
+		# flags of areas with raw data of this data type, or None if never set
+		if label not in self.__hasdata: return None
+		return self.__hasdata[label][:self.__n]
+	
+	def getDataMatrix(self, label, create = False):
+		# raw data matrix (areas x dates) of this data type, rows are Area.row()
+		# create: for writing, a matrix mapped from a cache (int32, see load) is first copied to int, so it cannot overflow
+		if label not in self.__data:
+			if not create: return None
+			self.__data[label] = np.zeros((self.__cap, self.lenData()), dtype = int)
+			self.__hasdata[label] = np.zeros(self.__cap, dtype = bool)
+		elif create and self.__data[label].dtype != int:
+			self.__data[label] = self.__data[label].astype(int)
+		return self.__data[label][:self.__n]
+	
+	def getTotalMask(self, label):
+		# flags of areas with a calculated total of this data type
+		self.getTotalMatrix(label)
+		return self.__valid[label][:self.__n]
+	
+	def getTotalMatrix(self, label):
+		# total matrix (areas x dates) of this data type, rows are Area.row()
+		if label not in self.__total:
+			self.__total[label] = np.zeros((self.__cap, self.lenData()), dtype = int)
+			self.__valid[label] = np.zeros(self.__cap, dtype = bool)
+		return self.__total[label][:self.__n]
+	
 	def lenData(self):
 		return len(self.__dates)
 	
+	def numRows(self):
+		return self.__n
+	
+	@staticmethod
+	def load(filename, mmap = False, include = None, lazy = False):
+		# binary cache if the file starts with the cache magic, a standard or transposed export (also compressed, see __loadText),
+		# else pickle (fallback for older caches)
+		# mmap: map the binary cache's matrices from the file instead of reading them (copy on write);
+		#   pages are read on first access and shared between processes through the OS page cache
+		# include: only load these countries (e.g. ['US']), the world's totals then only cover them
+		# lazy: only build the countries, each country's areas are built on first access (see expand)
+		with open(filename, 'rb') as f:
+			magic = f.read(len(CACHE_MAGIC))
+		if magic == CACHE_MAGIC: return World.__loadBinary(filename, mmap, include, lazy)
+		if magic.startswith(b'N|FIPS|') or filename.endswith(tuple(ce.COMPRESSION.values())): 
+			return World.__loadText(filename, include, lazy)
+		world = pickle.load(open(filename, 'rb'))
+		if include != None: print('Warning: include list ignored for pickled cache [' + filename + ']')
+		return world
+	
+	@staticmethod
+	def __loadBinary(filename, mmap = False, include = None, lazy = False):
+		# only json and raw numbers are read, nothing is executed
+		partial = mmap or include != None # map the file, only the rows used are read
+		with open(filename, 'rb') as f:
+			buf = f.read() if not partial else f.read(len(CACHE_MAGIC) + 8)
+			version, n_header = struct.unpack_from('<II', buf, len(CACHE_MAGIC))
+			if version > CACHE_VERSION: 
+				raise UsageError('load', 'Cache version ' + str(version) + ' is newer than supported (' + str(CACHE_VERSION) + ')')
+			start = len(CACHE_MAGIC) + 8
+			if partial: buf += f.read(n_header)
+		meta = json.loads(buf[start:start + n_header].decode('utf-8'))
+		base = -(-(start + n_header) // CACHE_ALIGN) * CACHE_ALIGN
+		rows, m = World.__includeRows(meta['areas'], include, filename)
+		arrays = {}
+		for name, spec in meta['arrays'].items():
+			if spec['dtype'] not in CACHE_DTYPES: raise UsageError('load', 'Unsupported dtype ' + spec['dtype'])
+			shape = tuple(spec['shape'])
+			if partial:
+				arrays[name] = np.memmap(filename, spec['dtype'], 'c', base + spec['offset'], shape) if np.prod(shape) > 0 \
+					else np.zeros(shape, dtype = spec['dtype'])
+				if rows is not None: arrays[name] = np.array(arrays[name][rows])
+			else:
+				arrays[name] = np.frombuffer(buf, spec['dtype'], int(np.prod(shape)), base + spec['offset']).reshape(shape)
+		return World.__build(meta['name'], datetime.fromisoformat(meta['start']) if meta['length'] > 0 else None, meta['length'], \
+			m, arrays, rows, mmap, lazy)
+	
+	@staticmethod
+	def __loadText(filename, include = None, lazy = False):
+		# rebuild a world from a standard or transposed export (see covid_export), parsed a column at a time
+		# the hierarchy comes from the ADM columns (the area's name is its last ADM), rows are sorted into depth first order;
+		# the exports only have totals, so an area's own data is its total less its subordinates' totals
+		# (an area has data if that is not all zeros; leaves also if they are countries or their country's total is not all zeros)
+		print('Loading World [' + filename + ']...')
+		header, body = ce.readText(filename).split('\n', 1)
+		columns = header.split('|')
+		w = len(columns)
+		cells = np.array(body.rstrip('\n').replace('\n', '|').split('|') if len(body.strip('\n')) > 0 else [], dtype = object)
+		if len(cells) % w != 0: raise UsageError('load', 'Rows of unequal length in [' + filename + ']')
+		cells = cells.reshape(-1, w)
+		standard = columns[:9] == ['N', 'FIPS', 'ADM3', 'ADM2', 'ADM1', 'KEY', 'LAT', 'LON', 'T']
+		if standard:
+			# standard: one row per area and data type (C, D, R), one column per date
+			dates = columns[9:]
+			keys = cells[:, 5]
+			attrs = {'fips': 1, 'adm3': 2, 'adm2': 3, 'adm1': 4, 'key': 5, 'lat': 6, 'lon': 7}
+		elif columns == ['N', 'FIPS', 'ADM3', 'ADM2', 'ADM1', 'DATE', 'KEY', 'LAT', 'LON', 'CONFIRMED', 'DEATHS', 'RECOVERED']:
+			# transposed: one row per area and date (in any order, e.g. appended)
+			index = {}
+			col = np.array([index.setdefault(d, len(index)) for d in cells[:, 5]], dtype = int)
+			dates = list(index.keys())
+			keys = cells[:, 6]
+			attrs = {'fips': 1, 'adm3': 2, 'adm2': 3, 'adm1': 4, 'key': 6, 'lat': 7, 'lon': 8}
+		else:
+			raise UsageError('load', 'Not a standard or transposed export [' + filename + ']')
+		index = {}
+		row = np.array([index.setdefault(k, len(index)) for k in keys], dtype = int)
+		first = np.zeros(len(index), dtype = int)
+		first[row[::-1]] = np.arange(len(row))[::-1] # first line of each area
+		# hierarchy: depth first order is the order of the ADM paths (a parent's path is a prefix of its subordinates')
+		paths = [tuple(adm for adm in cells[i, [4, 3, 2]] if adm != 'N/A') for i in first]
+		order = sorted(range(len(paths)), key = lambda i: paths[i])
+		if len(order) == 0 or len(paths[order[0]]) > 0: raise UsageError('load', 'No world row in [' + filename + ']')
+		rank = {paths[i]: r for r, i in enumerate(order)}
+		m = {k: [cells[first[i], c] for i in order] for k, c in attrs.items()}
+		m['lat'] = [float(v) for v in m['lat']]
+		m['lon'] = [float(v) for v in m['lon']]
+		m['name'] = [m['key'][0]] + [paths[i][-1] for i in order[1:]]
+		m['parent'] = [-1]
+		for r, i in enumerate(order[1:], 1):
+			p = rank.get(paths[i][:-1])
+			if p == None or m['key'][r] != (m['name'][r] if len(paths[i]) == 1 else m['name'][r] + ', ' + m['key'][p]): 
+				raise UsageError('load', 'Area ' + m['key'][r] + ' does not match its ADM columns in [' + filename + ']')
+			m['parent'].append(p)
+		del m['key']
+		# totals, in depth first order
+		dates = [datetime.strptime(d, '%m/%d/%Y') for d in dates]
+		if len(dates) > 0 and [(d - dates[0]).days for d in dates] != list(range(len(dates))): 
+			raise UsageError('load', 'Dates are not consecutive in [' + filename + ']')
+		remap = np.zeros(len(order), dtype = int)
+		remap[order] = np.arange(len(order))
+		row = remap[row]
+		parent = np.array(m['parent'], dtype = int)
+		leaf = np.ones(len(order), dtype = bool)
+		leaf[parent[1:]] = False
+		country = np.arange(len(order)) # row of the country of each row
+		while (parent[country] > 0).any(): country = np.where(parent[country] > 0, parent[country], country)
+		arrays = {}
+		for t, label in [('C', 'CONFIRMED'), ('D', 'DEATHS'), ('R', 'RECOVERED')]:
+			total = np.zeros((len(order), len(dates)), dtype = int)
+			if standard: 
+				rows = cells[:, 8] == t
+				total[row[rows]] = cells[rows, 9:].astype(int)
+			else:
+				total[row, col] = cells[:, columns.index(label)].astype(int)
+			data = total.copy()
+			np.add.at(data, parent[1:], -total[1:])
+			arrays['data/' + label] = data
+			arrays['total/' + label] = total
+			arrays['mask/' + label] = data.any(axis = 1) | (leaf & ((parent == 0) | total[country].any(axis = 1)))
+		rows, m = World.__includeRows(m, include, filename)
+		if rows is not None: arrays = {name: a[rows] for name, a in arrays.items()}
+		return World.__build(m['name'][0], dates[0] if len(dates) > 0 else None, len(dates), m, arrays, rows, False, lazy)
+	
+	@staticmethod
+	def __includeRows(m, include, filename):
+		# rows of the hierarchy table to load and the table of those rows
+		# (rows are in depth first order, so each country's subtree is a block of rows)
+		if include == None: return None, m
+		keep = np.zeros(len(m['name']), dtype = bool)
+		keep[0] = True
+		found = set()
+		inside = False
+		for i in range(1, len(keep)):
+			if m['parent'][i] == 0: 
+				inside = m['name'][i] in include
+				if inside: found.add(m['name'][i])
+			keep[i] = inside
+		for name in include:
+			if name not in found: print('Warning: ' + name + ' not found in cache [' + filename + ']')
+		rows = np.flatnonzero(keep)
+		remap = np.cumsum(keep) - 1
+		m = {k: [v[i] for i in rows] for k, v in m.items()}
+		m['parent'] = [-1] + [int(remap[p]) for p in m['parent'][1:]]
+		return rows, m
+	
 	@staticmethod
-	def load(filename):
-		return pickle.load(open(filename, 'rb'))
+	def __build(name, start, length, m, arrays, rows, mmap = False, lazy = False):
+		# world from a hierarchy table and its 'data/', 'total/' and 'mask/' arrays per data type (rows follow the table)
+		world = World(name, m['lat'][0], m['lon'][0])
+		if length > 0: world.setDates(start, length)
+		world.__buildAreas(m, lazy)
+		# data, mapped matrices are kept in the file's dtype until they are modified (see getDataMatrix);
+		# totals (only in caches of older versions and text exports) are always copied, as rollup writes them
+		for name in arrays:
+			if not name.startswith('data/'): continue
+			label = name[len('data/'):]
+			world.__data[label] = arrays[name] if mmap else arrays[name].astype(int)
+			world.__hasdata[label] = arrays['mask/' + label].copy()
+			if 'total/' + label in arrays:
+				world.__total[label] = arrays['total/' + label].astype(int)
+				world.__valid[label] = np.ones(world.__n, dtype = bool)
+				if rows is not None: world.__valid[label][0] = False # the world's total only covers included countries
+		return world
+	
+	def __buildAreas(self, m, lazy = False):
+		# bulk version of areaFactory for a whole hierarchy table (see __dumpBinary), rows follow the table
+		n = len(m['name'])
+		parent = m['parent']
+		level = [0] * n
+		country = [0] * n # row of the country each row belongs to
+		for i in range(1, n):
+			level[i] = level[parent[i]] + 1
+			country[i] = i if level[i] == 1 else country[parent[i]]
+		self.__n = n
+		self.__cap = n
+		self.__rows = {'parent': np.array(parent, dtype = int), 'level': np.array(level, dtype = int), \
+			'ignore': np.array([name.startswith('Unassigned') or name.startswith('Out of') for name in m['name']], dtype = bool)}
+		self.__plan = None
+		self.__lazy = {'table': m, 'level': level, 'country': country, 'areas': [self] + [None] * (n - 1), 'fips': {}, 'keys': {}}
+		if lazy:
+			for i in range(n - 1, 0, -1): # first row wins, as with indexFIPS
+				self.__lazy['fips'][m['fips'][i]] = i
+			keys = [None] * n # keys as __buildRows makes them (names may contain ', ', e.g. 'Korea, South')
+			for i in range(1, n):
+				keys[i] = m['name'][i] if level[i] == 1 else m['name'][i] + ', ' + keys[parent[i]]
+				self.__lazy['keys'][keys[i]] = i
+			self.__buildRows([i for i in range(1, n) if level[i] == 1], True)
+		else:
+			self.__buildRows(range(1, n))
+			self.__lazy = None
+	
+	def __buildRows(self, rows, lazy = False):
+		# create and index the areas of these table rows, parents first (see __buildAreas)
+		m = self.__lazy['table']
+		level = self.__lazy['level']
+		areas = self.__lazy['areas']
+		for i in rows:
+			p = areas[m['parent'][i]]
+			name = m['name'][i]
+			ar = Area.__new__(Area)
+			ar.__dict__ = {'a': {'lat': m['lat'][i], 'lon': m['lon'][i], 'name': name, 'level': level[i], \
+				'key': name if level[i] == 1 else name + ', ' + p.a['key'], 'adm1': m['adm1'][i], 'adm2': m['adm2'][i], \
+				'adm3': m['adm3'][i], 'fips': m['fips'][i]}, '_Area__parent': p, 'world': self, \
+				'_Area__s': None if lazy else {}, '_Area__i': i, '_Area__d': None, '_Area__t': None}
+			p._Area__s[name] = ar
+			areas[i] = ar
+			self.__keys[ar.a['key']] = ar
+			self.indexFIPS(ar, ar.a['fips'])
+	
+	def expand(self, area = None):
+		# build the subordinates of a lazily loaded country (default all countries)
+		if self.__lazy == None: return
+		lazy = self.__lazy
+		for c in ([area] if area != None else list(self.getAreas().values())):
+			if c._Area__s != None: continue
+			c._Area__s = {}
+			i = c.row()
+			j = i + 1
+			while j < len(lazy['country']) and lazy['country'][j] == i: j += 1
+			self.__buildRows(range(i + 1, j))
+		if all(c._Area__s != None for c in self.getAreas().values()): self.__lazy = None
+	
+	def indexArea(self, area):
+		# add the area to the key and FIPS indexes
+		self.__keys[area.key()] = area
+		self.indexFIPS(area, area.a['fips'])
+	
+	def indexFIPS(self, area, fips):
+		# (re)index the area under a new FIPS code; placeholders (N/A, 99999) are not indexed
+		if self.__fips.get(area.a['fips']) is area: del self.__fips[area.a['fips']]
+		if fips != 'N/A' and fips != '99999' and fips not in self.__fips: self.__fips[fips] = area
+	
+	def invalidate(self, area, label = None):
+		# mark the totals of the area and all of its parents as dirty (default all data types)
+		# a dirty area always has dirty parents, so the walk up stops at the first dirty parent
+		parent = self.__rows['parent']
+		for l in (list(self.__valid.keys()) if label == None else [label]):
+			if l not in self.__valid: continue
+			valid = self.__valid[l]
+			valid[area.row()] = False
+			i = parent[area.row()]
+			while i >= 0 and valid[i]:
+				valid[i] = False
+				i = parent[i]
+	
+	def rollup(self, label, ignore = False, area = None, recursive = False, dirty = False):
+		# recalculate the totals of the area (default world) and all of its subordinates
+		# single pass per level, deepest first: each level's totals are added into their parents' rows at once
+		# ignore: leave "unassigned", "out of" areas out of their parent's total
+		# recursive: use the area by area recursion instead (Area.rollupRecursive)
+		# dirty: only recalculate areas marked dirty (see invalidate), clean subordinates reuse their totals
+		if area == None: area = self
+		if recursive: return area.rollupRecursive(label, ignore)
+		n = self.__n
+		total = self.getTotalMatrix(label)
+		data = self.getDataMatrix(label)
+		valid = self.getTotalMask(label)
+		if area is self: 
+			sub = np.ones(n, dtype = bool)
+		else:
+			sub = self.subtreeMask(area)
+		if dirty: sub &= ~valid
+		if data is None: 
+			total[sub] = 0
+		else:
+			total[sub] = data[sub]
+		for level, rows in self.__getPlan():
+			if level <= area.level(): continue
+			keep = sub[self.__rows['parent'][rows]] # rows whose parent is recalculated
+			if ignore: keep &= ~self.__rows['ignore'][rows]
+			rows = rows[keep]
+			if len(rows) == 0: continue
+			parents = self.__rows['parent'][rows]
+			starts = np.flatnonzero(np.concatenate(([True], parents[1:] != parents[:-1]))) # first row of each parent
+			total[parents[starts]] += np.add.reduceat(total[rows], starts, axis = 0)
+		valid[sub] = True
+		return total[area.row()]
+	
+	def rollupMatrix(self, m, ignore = False):
+		# totals of a matrix of the areas' own values (one row per area, any columns, e.g. forecasts), summed up
+		# the hierarchy as rollup does
+		total = np.array(m[:self.__n])
+		for level, rows in self.__getPlan():
+			if ignore: rows = rows[~self.__rows['ignore'][rows]]
+			if len(rows) == 0: continue
+			parents = self.__rows['parent'][rows]
+			starts = np.flatnonzero(np.concatenate(([True], parents[1:] != parents[:-1]))) # first row of each parent
+			total[parents[starts]] += np.add.reduceat(total[rows], starts, axis = 0)
+		return total
+	
+	def __getPlan(self):
+		# [(level, rows at that level sorted by parent row)], deepest level first
+		if self.__plan == None:
+			n = self.__n
+			parent = self.__rows['parent'][:n]
+			level = self.__rows['level'][:n]
+			self.__plan = []
+			for l in range(level.max(), 0, -1):
+				rows = np.flatnonzero(level == l)
+				self.__plan.append((l, rows[np.argsort(parent[rows], kind = 'stable')]))
+		return self.__plan
+	
+	def subtreeMask(self, area):
+		# flags of the rows of the area and all of its subordinates
+		n = self.__n
+		parent = self.__rows['parent'][:n]
+		sub = np.zeros(n, dtype = bool)
+		sub[area.row()] = True
+		anc = parent.copy() # walk up one level at a time
+		while True:
+			up = anc >= 0
+			if not up.any(): break
+			sub[up] |= anc[up] == area.row()
+			anc[up] = parent[anc[up]]
+		return sub
 	
 	def setDates(self, startDate, length):
 		self.__dates = [datetime.now() for i in range(length)]
 		self.__dates[0] = startDate
 		for i in range(1, length):
 			self.__dates[i] = self.__dates[i-1] + timedelta(days=1)
+		# resize the date columns of the data matrices (new dates are zeros, totals need a recalc)
+		for d in [self.__data, self.__total]:
+			for label, m in d.items():
+				if m.shape[1] == length: continue
+				temp = np.zeros((self.__cap, length), dtype = m.dtype)
+				n = min(length, m.shape[1])
+				temp[:, :n] = m[:, :n]
+				d[label] = temp
+				if d is self.__total: self.__valid[label][:] = False
 
 # tests
 if __name__ == '__main__':
@@ -236,6 +236,29 @@ def generateGuides(world, label, yinit, days1 = 5, days2 = 10):
 	
 	return areas
 
+# compare 2 worlds, returns list of area keys that differ (attributes, data, or missing in either)
+def compareWorlds(w1, w2, labels = ['CONFIRMED', 'DEATHS', 'RECOVERED']):
+	diffs = []
+	if [d.date() for d in w1.getDates()] != [d.date() for d in w2.getDates()]: diffs.append(w1.key())
+	compareAreas(w1, w2, labels, diffs)
+	return diffs
+
+def compareAreas(a1, a2, labels, diffs):
+	same = True
+	for k in ['name', 'level', 'key', 'adm1', 'adm2', 'adm3', 'fips', 'lat', 'lon']:
+		if a1.a[k] != a2.a[k]: same = False
+	for label in labels:
+		if a1.hasData(label) != a2.hasData(label): same = False
+		elif a1.world.lenData() == a2.world.lenData() and not np.array_equal(a1.getData(label), a2.getData(label)): same = False
+	if not same and a1.key() not in diffs: diffs.append(a1.key())
+	s1 = a1.getAreas()
+	s2 = a2.getAreas()
+	for k in sorted(set(s1.keys()) | set(s2.keys())):
+		if k not in s1: diffs.append(s2[k].key())
+		elif k not in s2: diffs.append(s1[k].key())
+		else: compareAreas(s1[k], s2[k], labels, diffs)
+	return diffs
+
 # return array of indices from the array provided, e.g. [0, 1, 2, 3, 4...]
 def getIndexR(data, shift = 0):
 	# eg shift = 1, means array will start with 1 e.g. [1, 2, 3, 4...] but be of same length
@@ -245,7 +268,7 @@ def getIndexR(data, shift = 0):
 	return temp
 
 # this will ingest the JHU 'CONFIRMED' time series file into the data structure
-def ingestGlobalData(world, basepath, smooth = True):
+def ingestGlobalData(world, basepath, smooth = True, bulk = True):
 	print('Ingesting Global Data...')
 	print('  Directory: ' + basepath)
 	filehash = {}
@@ -263,8 +286,13 @@ def ingestGlobalData(world, basepath, smooth = True):
 	for k, (label, filename) in enumerate(filehash.items()):
 		datafile = path.abspath(path.join(basepath, filename))
 		print('  File: ' + filename)
+		if bulk: 
+			rows, m = readTimeSeries(datafile, date_col[label]) # whole file parsed into a 2D matrix
+			fixes = cs.Area.smoothMatrix(m) if smooth else np.zeros(len(m), dtype = int) # whole file smoothed at once
+		else:
+			rows = reader(open(datafile))
 		i = 0
-		for v in reader(open(datafile)):
+		for v in rows:
 			#print(i, v)
 			if (i == 0): # header row (first record)
 				temp = len(v)-date_col[label] # number of dates determined
@@ -281,18 +309,23 @@ def ingestGlobalData(world, basepath, smooth = True):
 			else:
 				c = world.areaFactory(v[1], float(v[2]), float(v[3])) # factory (get or create)
 				c.a['adm1'] = v[1]
-				data = np.zeros(n_dates, dtype = int) # gather data
-				for j in range(n_dates): 
-					data[j] = v[j+date_col[label]]
+				if bulk:
+					data = m[i-1] # row of the bulk matrix (already smoothed)
+					n_fixes = int(fixes[i-1])
+				else:
+					n_fixes = 0
+					data = np.zeros(n_dates, dtype = int) # gather data
+					for j in range(n_dates): 
+						data[j] = v[j+date_col[label]]
 				# print(data)
 				if (v[0] != ''):
 					s = c.areaFactory(v[0], float(v[2]), float(v[3])) # factory (get or create)
-					c_fixes += s.setData(label, data, smooth)
+					c_fixes += s.setData(label, data, smooth and not bulk) + n_fixes
 					s.a['adm1'] = v[1]
 					s.a['adm2'] = v[0]
 				else:
 					if (v[1] != 'US'): # skip US because it will be handled in the national pull
-						c_fixes += c.setData(label, data, smooth)
+						c_fixes += c.setData(label, data, smooth and not bulk) + n_fixes
 			i += 1
 		n_rows = i-1
 		n_row_max = max(n_row_max, n_rows)
@@ -302,7 +335,7 @@ def ingestGlobalData(world, basepath, smooth = True):
 	return n_row_max
 
 # US only
-def ingestNationalData(world, basepath, smooth = True):
+def ingestNationalData(world, basepath, smooth = True, bulk = True):
 	crDB = loadCountyReference()
 	srDB = loadStateReference()
 	print('Ingesting National Data...')
@@ -320,9 +353,14 @@ def ingestNationalData(world, basepath, smooth = True):
 	for k, (label, filename) in enumerate(filehash.items()):
 		datafile = path.abspath(path.join(basepath, filename))
 		print('  File: ' + filename)
+		if bulk: 
+			rows, m = readTimeSeries(datafile, date_col[label], 10) # whole file parsed into a 2D matrix
+			fixes = cs.Area.smoothMatrix(m) if smooth else np.zeros(len(m), dtype = int) # whole file smoothed at once
+		else:
+			rows = reader(open(datafile))
 		i = 0
 		geoAdjusts = 0
-		for v in reader(open(datafile)):
+		for v in rows:
 			# print(i, v)
 			if (i == 0): # header row (first record)
 				temp = len(v)-date_col[label] # number of dates determined
@@ -340,13 +378,18 @@ def ingestNationalData(world, basepath, smooth = True):
 				lon = 0.0 if len(v[9]) == 0 else float(v[9])
 				c = world.areaFactory(v[7], lat, lon) # factory (get or create)
 				c.a['adm1'] = v[7] # 'US'
-				data = np.zeros(n_dates, dtype = int) # gather data
-				for j in range(n_dates):
-					if j+date_col[label] >= len(v): # not enough data problem
-						print('      WARNING: Copy left value ' + v[len(v)-1] + ' at column ' + str(j+date_col[label]) + ' for \'' + v[10] + '\'')
-						data[j] = float(v[len(v)-1]) # copy left most recent
-					else:
-						data[j] = float(v[j+date_col[label]]) # float handles '0.0' case conversion
+				if bulk:
+					data = m[i-1] # row of the bulk matrix (already smoothed)
+					n_fixes = int(fixes[i-1])
+				else:
+					n_fixes = 0
+					data = np.zeros(n_dates, dtype = int) # gather data
+					for j in range(n_dates):
+						if j+date_col[label] >= len(v): # not enough data problem
+							print('      WARNING: Copy left value ' + v[len(v)-1] + ' at column ' + str(j+date_col[label]) + ' for \'' + v[10] + '\'')
+							data[j] = float(v[len(v)-1]) # copy left most recent
+						else:
+							data[j] = float(v[j+date_col[label]]) # float handles '0.0' case conversion
 				# print(data)
 				if (v[6] == ''): raise FormatError('Expected US ADM2! (Line ' + str(i+1) + ')')
 				lat = 0.0 if len(v[8]) == 0 else float(v[8])
@@ -355,18 +398,19 @@ def ingestNationalData(world, basepath, smooth = True):
 				s.a['adm1'] = v[7] # 'US'
 				s.a['adm2'] = v[6]
 				if (v[5] == ''): # state with no counties, e.g. PR, VI, GU, AS, Grand Princess
-					c_fixes += s.setData(label, data, smooth)
+					c_fixes += s.setData(label, data, smooth and not bulk) + n_fixes
 				else: # county or ADM3
 					lat = 0.0 if len(v[8]) == 0 else float(v[8])
 					lon = 0.0 if len(v[9]) == 0 else float(v[9])
 					s = s.areaFactory(v[5], lat, lon) # factory (get or create)
-					c_fixes += s.setData(label, data, smooth)
+					c_fixes += s.setData(label, data, smooth and not bulk) + n_fixes
 					s.a['adm1'] = v[7] # 'US'
 					s.a['adm2'] = v[6]
 					s.a['adm3'] = v[5]
 				# check FIPS
-				s.a['fips'] = checkFIPS(v[4].replace('.0',''), v)
-				if s.a['fips'] == '88888': s.a['fips'] = '99999' # diamond princess correction
+				fips = checkFIPS(v[4].replace('.0',''), v)
+				if fips == '88888': fips = '99999' # diamond princess correction
+				s.setFIPS(fips)
 				if s.a['fips'] == '99999':
 					s.a['lat'] = 0.0
 					s.a['lon'] = 0.0
@@ -419,22 +463,126 @@ def ingestNationalData(world, basepath, smooth = True):
 		print('    # Smoothing Ops (' + label + '): ' + str(c_fixes))
 	return n_rows
 
-def ingestData(basepath, name = 'World'):
+def ingestData(basepath, name = 'World', bulk = True):
 	# ingest data
+	# bulk: parse each file into a 2D matrix in one call (False => legacy cell by cell copy)
 	world = cs.World(name) # root object for data hierarchy
 	try:
-		n_rows = ingestGlobalData(world, basepath) # ingest the latest global time series data
+		n_rows = ingestGlobalData(world, basepath, bulk = bulk) # ingest the latest global time series data
 		checkGlobalData(world, n_rows) # check data structure
-		ingestNationalData(world, basepath) # ingest the latest US time series data
+		ingestNationalData(world, basepath, bulk = bulk) # ingest the latest US time series data
 		# will refresh and cascade subtotals
 		for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
-			world.getData(label, recalculate = True)
+			world.rollup(label)
 	except FormatError:
 		print('Ingestion Problems...  Halting.')
 		sys.exit(1)
 	# return world
 	return world
 
+# incremental ingest: append only the new JHU date columns to a cached world (e.g. world.p)
+# falls back to a full ingest when there is no cache, the hierarchy changed, or historical cells were revised
+# returns world, changed (area key -> 'new data', 'revised', 'added' or 'removed')
+def ingestIncremental(basepath, filename = None, name = 'World', smooth = True):
+	if filename == None:
+		# binary cache, or the older pickled cache if that is all there is
+		filename = path.abspath(path.join(path.dirname(__file__), '../data/world.cw'))
+		legacy = path.abspath(path.join(path.dirname(__file__), '../data/world.p'))
+		if not os.path.isfile(filename) and os.path.isfile(legacy): filename = legacy
+	if not os.path.isfile(filename):
+		print('Cache Not Found.  Ingesting...')
+		world = ingestData(basepath, name)
+		return world, {a.key(): 'added' for a in listAreas(world) if a.level() > 0}
+	print('Loading World from Cache...')
+	world = cs.World.load(filename)
+	print('Ingesting New Dates...')
+	print('  Directory: ' + basepath)
+	# file, label, first date column, global or national (same layout as ingestGlobalData / ingestNationalData)
+	files = [('time_series_covid19_confirmed_global.csv', 'CONFIRMED', 4, 'G'), 
+		('time_series_covid19_deaths_global.csv', 'DEATHS', 4, 'G'), 
+		('time_series_covid19_recovered_global.csv', 'RECOVERED', 4, 'G'), 
+		('time_series_covid19_confirmed_US.csv', 'CONFIRMED', 11, 'N'), 
+		('time_series_covid19_deaths_US.csv', 'DEATHS', 12, 'N')]
+	n_old = world.lenData()
+	n_dates = 0
+	changed = {}
+	updates = [] # (area, label, data) to apply when no full rebuild is needed
+	seen = set() # (area, label) found in the files, classified even once a rebuild is needed
+	rebuild = False
+	for datafile, label, date_col, scope in files:
+		print('  File: ' + datafile)
+		datafile = path.abspath(path.join(basepath, datafile))
+		rows, m = readTimeSeries(datafile, date_col, 10 if scope == 'N' else None)
+		# history as it would have been ingested (smoothing is deterministic), and the full new series
+		hist = m[:, :n_old].copy()
+		if smooth: 
+			cs.Area.smoothMatrix(hist)
+			cs.Area.smoothMatrix(m)
+		if (n_dates == 0): n_dates = m.shape[1]
+		if (n_dates != m.shape[1]): 
+			raise FormatError('Unequal Date Ranges (T5)! (' + str(n_dates) + '!=' + str(m.shape[1]) + ')')
+		if (scope == 'G'):
+			date = datetime.strptime(rows[0][date_col] + '20', '%m/%d/%Y')
+			if (date.date() != world.getDates()[0].date() or n_dates < n_old):
+				print('    Date Range Changed.')
+				rebuild = True
+		for i in range(1, len(rows)):
+			v = rows[i]
+			# locate the area (no creation)
+			if (scope == 'G'):
+				if (v[0] == '' and v[1] == 'US'): continue # handled in the national pull
+				ar = world.getArea(v[1])
+				if (ar != None and v[0] != ''): ar = ar.getArea(v[0])
+				key = v[1] if v[0] == '' else v[0] + ', ' + v[1]
+			else:
+				ar = world.getArea(v[7])
+				if (ar != None): ar = ar.getArea(v[6])
+				if (ar != None and v[5] != ''): ar = ar.getArea(v[5])
+				key = v[10]
+			if (ar == None or not ar.hasData(label)):
+				changed[key] = 'added'
+				rebuild = True
+				continue
+			seen.add((id(ar), label))
+			old = ar.getRawData(label)
+			data = m[i-1]
+			if (not np.array_equal(hist[i-1], old)):
+				changed[ar.key()] = 'revised'
+				rebuild = True
+				continue
+			# new dates that differ from the last known value (any value if there was no history)
+			if (not np.array_equal(data[:n_old], old) or (n_old == 0 and np.any(data != 0)) or \
+				(n_old > 0 and np.any(data[n_old:] != old[-1]))):
+				changed.setdefault(ar.key(), 'new data') # a revision of another label takes precedence
+			if (not rebuild): updates.append((ar, label, data))
+	# areas that have disappeared from the JHU files
+	for ar in listAreas(world):
+		for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+			if ar.hasData(label) and (id(ar), label) not in seen:
+				changed.setdefault(ar.key(), 'removed')
+				rebuild = True
+	print('    # Dates (Cache): ' + str(n_old))
+	print('    # Dates (JHU): ' + str(n_dates))
+	print('    # Changed Areas: ' + str(len(changed)))
+	if rebuild:
+		print('  Historical Revisions Found.  Full Ingest...')
+		return ingestData(basepath, name), changed
+	# append in place
+	world.setDates(world.getDates()[0], n_dates)
+	for ar, label, data in updates:
+		ar.setData(label, data, False)
+	for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+		world.getData(label) # recalculates the dirty areas only
+	return world, changed
+
+# list an area and all of its subordinate areas (depth first, sorted like areas())
+def listAreas(area, areas = None):
+	if areas == None: areas = []
+	areas.append(area)
+	for a in area.areas():
+		listAreas(a, areas)
+	return areas
+
 def loadCountyReference():
 	print('Loading County Reference CSV Resource...')
 	db = {}
@@ -459,9 +607,12 @@ def loadStateReference():
 	print('  # States and Territories: ' + str(len(db[0])))
 	return db
 
-def fetchWorld(filename = None):
+def fetchWorld(filename = None, mmap = False, include = None, lazy = False):
 	if filename == None:
-		filename = path.abspath(path.join(path.dirname(__file__), '../data/world.p'))
+		# binary cache, or the older pickled cache if that is all there is
+		filename = path.abspath(path.join(path.dirname(__file__), '../data/world.cw'))
+		legacy = path.abspath(path.join(path.dirname(__file__), '../data/world.p'))
+		if not os.path.isfile(filename) and os.path.isfile(legacy): filename = legacy
 	if not os.path.isfile(filename):
 		print('Cache Not Found.  Ingesting...')
 		# ingest (assumes JHU's COVID-19 is installed under the root directory as COVID-19-TOOLS)
@@ -475,7 +626,7 @@ def fetchWorld(filename = None):
 		return world
 	# try to load
 	print('Loading World from Cache...', end=' ')
-	world = cs.World.load(filename)
+	world = cs.World.load(filename, mmap, include, lazy)
 	print(fileSize(filename))
 	return world
 
@@ -486,6 +637,28 @@ def addArrays(a, b):
 		a[i] += b[i]
 	return a
 
+# read a whole JHU time series file at once, returns (rows, matrix)
+# rows: all csv rows including the header; matrix: 2D integer array of the date columns (one row per data row)
+def readTimeSeries(datafile, date_col, key_col = None):
+	# date_col: index of the first date column
+	# key_col: column used to name a row in warnings, e.g. the US Combined_Key
+	with open(datafile) as f:
+		rows = list(reader(f))
+	len_h = len(rows[0])
+	cells = []
+	for i in range(1, len(rows)):
+		v = rows[i]
+		if len(v) < len_h: # not enough data problem
+			for j in range(len(v), len_h):
+				print('      WARNING: Copy left value ' + v[len(v)-1] + ' at column ' + str(j) + ' for \'' + \
+					(v[key_col] if key_col != None else str(i+1)) + '\'')
+			v = v + [v[len(v)-1]] * (len_h - len(v)) # copy left most recent
+		cells.append(v[date_col:len_h])
+	if len(cells) == 0: return rows, np.zeros((0, len_h - date_col), dtype = int)
+	# single conversion of every date cell; float handles '0.0' case conversion
+	m = np.array(cells, dtype = float).astype(int)
+	return rows, m
+
 def readConfig(configfile = None):
 	if configfile == None: configfile = path.abspath(path.join(path.dirname(__file__), '..', 'config.properties'))
 	print(configfile)
@@ -504,6 +677,8 @@ def readConfig(configfile = None):
 	if 'COVID-19-DIR' not in keys:
 		# export (assumes JHU's COVID-19 is installed under the root directory as COVID-19-TOOLS)
 		keys['COVID-19-DIR'] = path.abspath(path.join(path.dirname(__file__), '../../COVID-19/csse_covid_19_data/csse_covid_19_time_series/'))
+	if 'EXPORT-PROCESSES' not in keys: keys['EXPORT-PROCESSES'] = '1'
+	if 'FORECAST-DAYS' not in keys: keys['FORECAST-DAYS'] = '0'
 	return keys
 
 # sum 2 numpy arrays with the result having the longest length, left-justified/aligned
@@ -10,7 +10,9 @@ from os import listdir, path
 from os.path import isfile, join
 
 import covid_structures as cs
+import covid_export as ce
 import covid_tools as ct
+import covid_models as cm
 
 if __name__ == '__main__':
 	start = timer()
@@ -19,18 +21,41 @@ if __name__ == '__main__':
 	print('Starting... (' + dt_string + ' Z)')
 	
 	props = ct.readConfig()
-	world = ct.ingestData(props['COVID-19-DIR'])
-
-	print('++++++++++++++++++++++++++++++++++++++++++++')
-	world.exportStandard(path.abspath(path.join(path.dirname(__file__), '..', 'data', 'data_standard.txt')))
-	world.exportTransposed(path.abspath(path.join(props['EXPORT-DIR'], 'data_transposed.txt')))
-	world.exportShapefile(path.abspath(path.join(props['EXPORT-DIR'], 'data_covid.shp')))
-	world.exportTransposedPGIS(path.abspath(path.join(props['EXPORT-DIR'], 'data_transposed.sql')))
-	world.dump(path.abspath(path.join(path.dirname(__file__), '..', 'data', 'world.p')))
+	# incremental against yesterday's cache; falls back to a full ingest on historical revisions
+	world, changed = ct.ingestIncremental(props['COVID-19-DIR']) # data/world.cw (or world.p)
+	print('# Changed Areas: ' + str(len(changed)))
 	
-	print('\nReplicating...') # these could be copy commands
-	world.exportStandard(path.abspath(path.join(props['EXPORT-DIR'], 'data_standard.txt')))
-	world.dump(path.abspath(path.join(props['EXPORT-DIR'], 'world.p')))
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	# all formats in one pass over the hierarchy (or in partitions on EXPORT-PROCESSES processes);
+	# the second standard export is a copy of the first; the transposed exports only get the new dates' rows appended
+	# unless history was revised (the .state files next to them have the N range appended for loading);
+	# exports whose data did not change since the last run are skipped (manifest.json next to them)
+	targets = [('standard', path.abspath(path.join(path.dirname(__file__), '..', 'data', 'data_standard.txt'))), \
+		('transposed', path.abspath(path.join(props['EXPORT-DIR'], 'data_transposed.txt')), {'append': True}), \
+		('shapefile', path.abspath(path.join(props['EXPORT-DIR'], 'data_covid.shp'))), \
+		('pgis', path.abspath(path.join(props['EXPORT-DIR'], 'data_transposed.sql')), {'append': True}), \
+		('sqlite', path.abspath(path.join(props['EXPORT-DIR'], 'data_transposed.sqlite')), {'append': True}), \
+		('standard', path.abspath(path.join(props['EXPORT-DIR'], 'data_standard.txt')))]
+	if int(props['FORECAST-DAYS']) > 0:
+		# every area's forecast, next to data_standard.txt; fits are memoized across runs (data/fits.json)
+		model = cm.Model_T1()
+		fitsfile = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'fits.json'))
+		if path.isfile(fitsfile): model.loadCache(fitsfile)
+		forecasts = model.forecastWorld(world, ['CONFIRMED', 'DEATHS'], int(props['FORECAST-DAYS']), processes = int(props['EXPORT-PROCESSES']))
+		model.saveCache(fitsfile)
+		targets.append(('forecast', path.abspath(path.join(props['EXPORT-DIR'], 'data_forecast.txt')), {'forecasts': forecasts}))
+	skipped = world.export(targets, int(props['EXPORT-PROCESSES']), manifest = True)
+	caches = [path.abspath(path.join(path.dirname(__file__), '..', 'data', cache)) for cache in ['world.cw', 'world.p']]
+	if len(skipped) == len(targets) and all([path.isfile(cache) for cache in caches]): 
+		# nothing new, the caches stay as they are (and there is nothing to commit)
+		print('\nUnchanged, skipped [' + '], ['.join(caches) + ']')
+	else:
+		world.dump(caches[0])
+		world.dump(caches[1]) # pickle, for older clients
+		
+		print('\nReplicating...')
+		for cache in caches:
+			ce.Writer.copy(cache, path.abspath(path.join(props['EXPORT-DIR'], path.basename(cache))))
 	
 	print('\nDone.')
 	duration = timer()-start
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark the export formats, one at a time, all in a single pass, and in parallel
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import multiprocessing
+
+import covid_structures as cs
+import covid_export as ce
+import covid_tools as ct
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	basepath = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'test_export'))
+	if not os.path.isdir(basepath): os.mkdir(basepath)
+	targets = [('standard', path.join(basepath, 'data_standard.txt')), ('transposed', path.join(basepath, 'data_transposed.txt')), \
+		('pgis', path.join(basepath, 'data_transposed.sql')), ('shapefile', path.join(basepath, 'data_covid.shp')), \
+		('sqlite', path.join(basepath, 'data_transposed.sqlite'))]
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	durations = {}
+	for format, filename in targets:
+		t = timer()
+		world.export([(format, filename)])
+		durations[format] = timer() - t
+	t = timer()
+	world.export(targets)
+	durations['all'] = timer() - t
+	for processes in sorted(set([2, 4, multiprocessing.cpu_count()])):
+		t = timer()
+		world.export(targets, processes)
+		durations['all (' + str(processes) + ' processes)'] = timer() - t
+	# shapefile split by month or country (narrow DBFs), on all processors
+	for partition in ce.ShapefileWriter.partitions:
+		t = timer()
+		world.exportShapefile(path.join(basepath, 'data_covid.shp'), partition, multiprocessing.cpu_count())
+		durations['shapefile (by ' + partition + ')'] = timer() - t
+	# compressed, streamed (no separate compression pass)
+	for codec, ext in ce.COMPRESSION.items():
+		filename = path.join(basepath, 'data_transposed.txt' + ext)
+		t = timer()
+		world.exportTransposed(filename)
+		durations['transposed (' + codec + ')'] = timer() - t
+		print('  ' + codec + ': ' + ct.fileSize(filename))
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	for format, duration in durations.items():
+		print('  ' + format + ': {:0.2f}s'.format(duration))
+	print('  Sum of single formats: {:0.2f}s'.format(sum([durations[format] for format, filename in targets])))
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark batch curve fitting (Model_T1) of all US counties on more and more processes, and warm started and memoized fits
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import multiprocessing
+import numpy as np
+
+import covid_structures as cs
+import covid_tools as ct
+import covid_models as cm
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	areas = [county for state in world.getArea('US').areas() for county in state.areas()]
+	if len(sys.argv) > 2: areas = areas[:int(sys.argv[2])] # e.g. test_fitting.py ../data/world.cw 500
+	print('# Areas: ' + str(len(areas)))
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	durations = {}
+	tables = {}
+	for processes in sorted(set([1, 2, 4, multiprocessing.cpu_count()])):
+		model = cm.Model_T1() # nothing memoized
+		t = timer()
+		tables[processes], fits = model.calculateAreas(areas, 'CONFIRMED', processes = processes)
+		durations[processes] = timer() - t
+	for processes, duration in durations.items():
+		same = all([np.array_equal(tables[processes][k], tables[1][k], equal_nan = tables[1][k].dtype.kind == 'f') for k in tables[1].dtype.names])
+		print('  ' + str(processes) + ' processes: {:0.2f}s, {:0.0f} fits/s, {:0.1f}x'.format(duration, len(areas) / duration, \
+			durations[1] / duration) + (' (same results)' if same else ' (DIFFERENT RESULTS)'))
+	table = tables[1]
+	print('  Fitted: ' + str(np.count_nonzero(~np.isnan(table['a']))) + ', r-squared > 0.95: ' + str(np.count_nonzero(table['rsqd'] > 0.95)) + \
+		', errors: ' + str(np.count_nonzero(table['error'] != '')))
+	# results store: one area at a time into the stats (more than the 100 rows first allocated), then filtered, sorted, exported
+	model = cm.Model_T1()
+	model.results.extend(table)
+	for area in areas[:200]:
+		model.calculate(world.getDates(), area.getData('DEATHS'), 'DEATHS', key = area.key())
+	good = model.results.where(model.results['rsqd'] > 0.95).sort(['label', 'rsqd'], reverse = True)
+	print('  Results: ' + str(len(model.results)) + ' rows, ' + str(len(good)) + ' with r-squared > 0.95, best: ' + \
+		str(good.table()[:3][['key', 'label', 'rsqd']].tolist()))
+	filename = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'test_fits.txt'))
+	good.export(filename)
+	print('  ' + ct.fileSize(filename))
+	os.remove(filename)
+	# a day's refit: yesterday's data (one date less) first, then today's from the saved cache, then today's again
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	cachefile = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'test_fits.json'))
+	y_matrix = np.array([area.getData('CONFIRMED') for area in areas])
+	keys = [area.key() for area in areas]
+	for warm in [False, True]:
+		model = cm.Model_T1(warm)
+		for run, n_dates in [('yesterday', world.lenData() - 1), ('today', world.lenData()), ('today again', world.lenData())]:
+			if run == 'today': 
+				model.saveCache(cachefile)
+				model = cm.Model_T1(warm)
+				model.loadCache(cachefile)
+			model.n_fits = model.n_hits = 0
+			t = timer()
+			table, fits = model.calculateMatrix(world.getDates()[:n_dates], y_matrix[:, :n_dates], keys)
+			duration = timer() - t
+			print('  ' + ('warm' if warm else 'cold') + ', ' + run + ': {:0.2f}s, {:0.0f} series/s'.format(duration, len(areas) / duration) + \
+				', ' + str(model.n_fits) + ' fits, ' + str(model.n_hits) + ' memoized, r-squared > 0.95: ' + \
+				str(np.count_nonzero(table['rsqd'] > 0.95)) + ', maxfev failures: ' + str(np.count_nonzero(table['error'] == 'RuntimeError')))
+	os.remove(cachefile)
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark forecasting every area of the world at once (Model_T1.forecastWorld) against area by area, and its export
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import multiprocessing
+import numpy as np
+
+import covid_structures as cs
+import covid_tools as ct
+import covid_models as cm
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	n_forecast = 7 if len(sys.argv) < 3 else int(sys.argv[2]) # e.g. test_forecast.py ../data/world.cw 14
+	mask = world.getDataMask('CONFIRMED')
+	print('# Areas: ' + str(world.numRows()) + ', with data: ' + str(np.count_nonzero(mask)) + ', days: ' + str(n_forecast))
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	model = cm.Model_T1()
+	t = timer()
+	forecasts = model.forecastWorld(world, ['CONFIRMED', 'DEATHS'], n_forecast, processes = multiprocessing.cpu_count())
+	print('  Fitted and forecast: {:0.2f}s'.format(timer() - t))
+	t = timer()
+	forecasts = model.forecastWorld(world, ['CONFIRMED', 'DEATHS'], n_forecast) # memoized fits
+	print('  Forecast again (memoized fits): {:0.2f}s'.format(timer() - t))
+	# the same forecast area by area: calculate's ym_data past the data of each area with its own data, summed up by hand
+	d_data = world.getDates()
+	data = world.getDataMatrix('CONFIRMED')
+	rows = np.flatnonzero(mask)
+	t = timer()
+	own = np.zeros((world.numRows(), n_forecast), dtype = np.int64)
+	for i in rows:
+		y_data = data[i]
+		own[i] = y_data[-1]
+		popt, rsqd, xm_data, ym_data, si = model.calculate(d_data, y_data, None, n_forecast)
+		if ym_data is not None:
+			f = ym_data[-n_forecast:]
+			if np.isfinite(f).all() and (np.abs(f) < 2 ** 53).all(): own[i] = f
+	print('  Area by area (memoized fits): {:0.2f}s'.format(timer() - t))
+	m = forecasts['CONFIRMED']
+	table, fits = model.calculateMatrix(d_data, data[rows])
+	print('  Same forecasts: ' + str(np.array_equal(model.forecastMatrix(table, data[rows], n_forecast), own[rows])))
+	# totals: each parent's forecast is its own plus its subordinates' (as getData's totals)
+	us = world.getArea('US')
+	print('  US: ' + str(m[us.row()].tolist()) + ', sum of states: ' + str(sum([m[a.row()] for a in us.areas()]).tolist()) + \
+		', last: ' + str(us.getData('CONFIRMED')[-1]))
+	filename = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'test_forecast.txt'))
+	t = timer()
+	world.exportForecast(filename, forecasts)
+	print('  Exported: {:0.2f}s, '.format(timer() - t) + ct.fileSize(filename))
+	os.remove(filename)
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
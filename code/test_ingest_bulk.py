@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Timing comparison of the bulk (matrix) ingest against the legacy cell by cell ingest
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+from os import listdir, path
+from os.path import isfile, join
+import sys
+
+import covid_structures as cs
+import covid_tools as ct
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	# ingest (assumes JHU's COVID-19 is installed under the root directory as COVID-19-TOOLS), or pass the directory
+	basepath = path.abspath(path.join(path.dirname(__file__), '../../COVID-19/csse_covid_19_data/csse_covid_19_time_series/'))
+	if len(sys.argv) > 1: basepath = sys.argv[1]
+	
+	t = timer()
+	world_l = ct.ingestData(basepath, bulk = False)
+	duration_l = timer()-t
+	t = timer()
+	world_b = ct.ingestData(basepath, bulk = True)
+	duration_b = timer()-t
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	diffs = ct.compareWorlds(world_l, world_b)
+	print('Identical: ' + str(len(diffs) == 0) + ' (' + str(len(diffs)) + ' differences)')
+	for k in diffs[:20]: print('  ' + k)
+	print('Legacy Ingest: {:0.2f}s'.format(duration_l))
+	print('Bulk Ingest: {:0.2f}s'.format(duration_b))
+	print('Speedup: {:0.2f}x'.format(duration_l / duration_b))
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark the models (exponential, logistic, Gompertz) on every area of the world: fit time, convergence and best fits
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import multiprocessing
+import numpy as np
+
+import covid_structures as cs
+import covid_tools as ct
+import covid_models as cm
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	# every area's own series (raw data), as forecastWorld fits them
+	keys = {area.row(): area.key() for area in world.exportAreas()}
+	rows = np.flatnonzero(world.getDataMask('CONFIRMED'))
+	if len(sys.argv) > 2: rows = rows[:int(sys.argv[2])] # e.g. test_models.py ../data/world.cw 500
+	y_matrix = world.getDataMatrix('CONFIRMED')[rows]
+	print('# Areas: ' + str(len(rows)))
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	models = {name: cls() for name, cls in cm.MODELS.items()}
+	t = timer()
+	table, names, tables = cm.bestFits(world.getDates(), y_matrix, [keys[i] for i in rows], 'CONFIRMED', models, \
+		processes = multiprocessing.cpu_count())
+	duration = timer() - t
+	for name, model in models.items():
+		converged = (tables[name]['error'] == '') & ~np.isnan(tables[name]['a'])
+		# fit time of each model from a second run of its fits alone (memoized fits cleared)
+		model.cache = {}
+		model.last = {}
+		t = timer()
+		model.calculateMatrix(world.getDates(), y_matrix, [keys[i] for i in rows], 'CONFIRMED')
+		d = timer() - t
+		print('  ' + name + ' (' + model.a['type'] + '): {:0.2f}s, {:0.0f} fits/s'.format(d, len(rows) / d) + \
+			', converged: {:0.1f}%'.format(100 * np.count_nonzero(converged) / max(len(rows), 1)) + \
+			', r-squared > 0.95: ' + str(np.count_nonzero(tables[name]['rsqd'] > 0.95)) + \
+			', best: ' + str(np.count_nonzero(names == name)))
+	print('  Best of all ({:0.2f}s): r-squared > 0.95: '.format(duration) + str(np.count_nonzero(table['rsqd'] > 0.95)) + \
+		', no fit: ' + str(np.count_nonzero(names == '')))
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Check the PostgreSQL binary COPY export offline against the text COPY export, with a decoder written from the format spec
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import struct
+from decimal import Decimal
+
+import covid_structures as cs
+import covid_tools as ct
+
+# binary numeric: ndigits, weight, sign, dscale, then base 10000 digits
+def decodeNumeric(b):
+	ndigits, weight, sign, dscale = struct.unpack('>hhHh', b[:8])
+	digits = struct.unpack('>' + str(ndigits) + 'h', b[8:])
+	value = Decimal(0)
+	for i, digit in enumerate(digits):
+		value += Decimal(digit).scaleb(4 * (weight - i))
+	if sign == 0x4000: value = -value
+	return value.quantize(Decimal(1).scaleb(-dscale))
+
+# EWKB point: byte order, type with the SRID flag, SRID, x, y
+def decodePoint(b):
+	order = '<' if b[0] == 1 else '>'
+	type, srid, x, y = struct.unpack(order + 'IIdd', b[1:])
+	if type != 0x20000001: raise ValueError('Not a point with SRID')
+	return srid, x, y
+
+# yields the tuples as lists of raw fields (None for NULL)
+def readCopy(filename):
+	with open(filename, 'rb') as f:
+		buf = f.read()
+	if buf[:11] != b'PGCOPY\n\xff\r\n\0': raise ValueError('Bad signature')
+	flags, extension = struct.unpack('>ii', buf[11:19])
+	pos = 19 + extension
+	while True:
+		n, = struct.unpack('>h', buf[pos:pos + 2])
+		pos += 2
+		if n == -1: break
+		row = []
+		for i in range(n):
+			l, = struct.unpack('>i', buf[pos:pos + 4])
+			pos += 4
+			if l == -1:
+				row.append(None)
+				continue
+			row.append(buf[pos:pos + l])
+			pos += l
+		yield row
+	if pos != len(buf): raise ValueError('Data after the trailer')
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	basepath = path.abspath(path.join(path.dirname(__file__), '..', 'data', 'test_export'))
+	if not os.path.isdir(basepath): os.mkdir(basepath)
+	files = {'text': path.join(basepath, 'data_transposed.sql'), 'binary': path.join(basepath, 'data_transposed.pgcopy')}
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	durations = {}
+	for kind, filename in files.items():
+		t = timer()
+		world.exportTransposedPGIS(filename, binary = kind == 'binary')
+		durations[kind] = timer() - t
+		print('  ' + kind + ': {:0.2f}s, '.format(durations[kind]) + ct.fileSize(filename))
+	t = timer()
+	epoch = datetime(2000, 1, 1)
+	rows, mismatches = 0, 0
+	with open(files['text'], 'r') as f:
+		for line, row in zip(f, readCopy(files['binary'])):
+			text = line.rstrip('\n').split('|')
+			srid, lon, lat = decodePoint(row[9])
+			decoded = [str(struct.unpack('>i', row[0])[0]), row[1].decode('utf-8'), \
+				(epoch + timedelta(days = struct.unpack('>i', row[2])[0])).strftime('%Y-%m-%d')] + \
+				[v.decode('utf-8') for v in row[3:7]] + \
+				[decodeNumeric(row[7]), decodeNumeric(row[8])] + [str(struct.unpack('>i', v)[0]) for v in row[10:13]]
+			expected = text[:7] + [Decimal(text[7]).quantize(Decimal('0.000001')), Decimal(text[8]).quantize(Decimal('0.000001'))] + text[9:]
+			if decoded != expected or srid != 4326 or lon != float(text[8]) or lat != float(text[7]): 
+				if mismatches < 10: print('  Mismatch: ' + str(decoded) + ' ' + str(expected))
+				mismatches += 1
+			rows += 1
+	print('  Decoded ' + str(rows) + ' rows in {:0.2f}s'.format(timer() - t))
+	with open(files['text'], 'r') as f:
+		lines = sum(1 for line in f)
+	if rows != lines or rows != sum(1 for row in readCopy(files['binary'])): mismatches += 1 # zip stops at the shorter one
+	print('  Mismatches: ' + str(mismatches))
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark the vectorized hierarchy rollup against the recursive rollup
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+from os import listdir, path
+from os.path import isfile, join
+import numpy as np
+import sys
+
+import covid_structures as cs
+import covid_tools as ct
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	n_runs = 10
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	for area in [world, world.getArea('US')]:
+		for ignore in [False, True]:
+			results = {}
+			durations = {}
+			for recursive in [True, False]:
+				t = timer()
+				for i in range(n_runs):
+					for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']:
+						world.rollup(label, ignore, area, recursive)
+				durations[recursive] = (timer()-t) / n_runs
+				results[recursive] = {label: world.getTotalMatrix(label)[world.subtreeMask(area)].copy() \
+					for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']}
+			same = all([np.array_equal(results[True][label], results[False][label]) for label in results[True]])
+			print(area.name() + ' (' + str(np.count_nonzero(world.subtreeMask(area))) + ' areas, ignore=' + str(ignore) + ')')
+			print('  Identical: ' + str(same))
+			print('  Recursive: {:0.4f}s'.format(durations[True]))
+			print('  Vectorized: {:0.4f}s'.format(durations[False]))
+			print('  Speedup: {:0.2f}x'.format(durations[True] / durations[False]))
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
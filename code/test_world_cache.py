@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Benchmark loading the binary world cache (read or memory-mapped) against the pickled cache
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+
+import covid_structures as cs
+import covid_tools as ct
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	basepath = path.abspath(path.join(path.dirname(__file__), '..', 'data'))
+	files = {'pickle': path.join(basepath, 'test_world.p'), 'binary': path.join(basepath, 'test_world.cw')}
+	n_runs = 10
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	for kind, filename in files.items():
+		world.dump(filename)
+		print('  ' + kind + ': ' + ct.fileSize(filename))
+	durations = {}
+	for kind, filename, mmap in [('pickle', files['pickle'], False), ('binary', files['binary'], False), ('mapped', files['binary'], True)]:
+		t = timer()
+		for i in range(n_runs):
+			loaded = cs.World.load(filename, mmap)
+		durations[kind] = (timer() - t) / n_runs
+		diffs = ct.compareWorlds(world, loaded, ['CONFIRMED', 'DEATHS'])
+		print('  ' + kind + ' load: {:0.4f}s'.format(durations[kind]) + ' (' + str(len(diffs)) + ' differences)')
+	print('  Speedup: {:0.1f}x (binary), {:0.1f}x (mapped)'.format(durations['pickle'] / durations['binary'], durations['pickle'] / durations['mapped']))
+	# workers reading a few areas only touch those rows' pages
+	t = timer()
+	loaded = cs.World.load(files['binary'], True)
+	for fips in ['51059', '36061', '06037']:
+		area = loaded.getAreaByFIPS(fips)
+		if area != None: print('  ' + area.key() + ': ' + str(area.getData('CONFIRMED')[-1]))
+	print('  Mapped load and lookup: {:0.4f}s'.format(timer() - t))
+	del loaded
+	# single country jobs
+	for kind, include, lazy in [('lazy', None, True), ('US only', ['US'], False), ('Italy only', ['Italy'], False)]:
+		t = timer()
+		for i in range(n_runs):
+			loaded = cs.World.load(files['binary'], include = include, lazy = lazy)
+		durations[kind] = (timer() - t) / n_runs
+		print('  ' + kind + ' load: {:0.4f}s'.format(durations[kind]) + ' (' + str(loaded.numRows()) + ' areas)')
+	t = timer()
+	loaded = cs.World.load(files['binary'], lazy = True)
+	area = loaded.getAreaByKey('Fairfax, Virginia, US')
+	print('  Lazy load and US lookup: {:0.4f}s'.format(timer() - t))
+	for filename in files.values():
+		os.remove(filename)
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Purpose: Rebuild the world from its standard and transposed exports, check it against the cache and time the loads
+#
+from datetime import datetime
+from datetime import timedelta
+from timeit import default_timer as timer
+import os
+from os import listdir, path
+from os.path import isfile, join
+import sys
+import filecmp
+
+import covid_structures as cs
+import covid_tools as ct
+
+if __name__ == '__main__':
+	start = timer()
+	now = datetime.now()
+	dt_string = now.strftime('%d/%m/%Y %H:%M:%S')
+	print('Starting... (' + dt_string + ' Z)')
+	
+	world = ct.fetchWorld() if len(sys.argv) < 2 else ct.fetchWorld(sys.argv[1])
+	basepath = path.abspath(path.join(path.dirname(__file__), '..', 'data'))
+	files = {'pickle': path.join(basepath, 'test_world.p'), 'binary': path.join(basepath, 'test_world.cw'), \
+		'standard': path.join(basepath, 'test_standard.txt'), 'transposed': path.join(basepath, 'test_transposed.txt'), \
+		'transposed (gzip)': path.join(basepath, 'test_transposed.txt.gz')}
+	
+	print('++++++++++++++++++++++++++++++++++++++++++++')
+	world.dump(files['pickle'])
+	world.dump(files['binary'])
+	world.export([('standard', files['standard']), ('transposed', files['transposed']), ('transposed', files['transposed (gzip)'])])
+	durations = {}
+	for kind, filename in files.items():
+		t = timer()
+		loaded = cs.World.load(filename)
+		durations[kind] = timer() - t
+		# totals are the same; only which areas hold raw data can differ (the exports do not have it)
+		diffs = ct.compareWorlds(world, loaded, [])
+		totals = [a.key() for a in world.exportAreas() if any([(a.getData(label) != loaded.getAreaByKey(a.key()).getData(label)).any() \
+			for label in ['CONFIRMED', 'DEATHS', 'RECOVERED']])] if len(diffs) == 0 else []
+		print('  ' + kind + ' load: {:0.2f}s'.format(durations[kind]) + ' (' + str(len(diffs)) + ' hierarchy differences, ' + \
+			str(len(totals)) + ' total differences)')
+	# the rebuilt world exports the same file
+	loaded = cs.World.load(files['standard'])
+	loaded.exportStandard(files['standard'] + '.2')
+	print('  Same standard export: ' + str(filecmp.cmp(files['standard'], files['standard'] + '.2', False)))
+	os.remove(files['standard'] + '.2')
+	for filename in files.values():
+		os.remove(filename)
+	
+	print('\nDone.')
+	duration = timer()-start
+	print('Execution Time: {:0.2f}s'.format(duration))
@@ -10,11 +10,17 @@ python3 export.py
 
 git add ../data/data_standard.txt
 git add ../data/world.p
+git add ../data/world.cw
 
-d=`date +%m-%d-%Y`
-git commit -m "Daily Update - ${d}"
-
-git push
+# on quiet days the export skips unchanged files (see export.py), so there may be nothing to commit
+if git diff --cached --quiet; then
+	echo "No changes."
+else
+	d=`date +%m-%d-%Y`
+	git commit -m "Daily Update - ${d}"
+	
+	git push
+fi
 
 cd ~/covid-19-tools/scripts
 echo "Done."
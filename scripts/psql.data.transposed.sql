@@ -23,3 +23,7 @@ CREATE INDEX key_idx ON timeseries (key);
 CREATE INDEX confirmed_idx ON timeseries (confirmed);
 CREATE INDEX deaths_idx ON timeseries (deaths);
 CREATE INDEX geom_idx ON timeseries USING GIST(geom);
+
+-- loading the exports (exportTransposedPGIS):
+-- COPY timeseries (id, key, date, fips, adm3, adm2, adm1, lat, lon, confirmed, deaths, recovered) FROM '/path/data_transposed.sql' WITH (DELIMITER '|');
+-- COPY timeseries FROM '/path/data_transposed.pgcopy' WITH (FORMAT binary); -- binary = True, geom included